@@ -0,0 +1,153 @@
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+# Classes, modules and packages hugged by the benchmark suite. Every factory returns a
+# new class, so each hugger wraps its own copy and the plain one stays untouched.
+
+import asyncio
+import os
+import types
+
+
+def make_class(n_members=0):
+    """The class most benchmarks hug, with `n_members` extra no-op methods."""
+
+    class Foo:
+        def __init__(self, value=0):
+            self.value = value
+            self._a = 0
+
+        def method(self, value, scale=1):
+            return value
+
+        def pair(self, value):
+            return value, [value]
+
+        def step(self, i, scale=1.0):
+            return i * scale
+
+        def accumulate(self, value):
+            # Reads the state, so dropping a set it depends on shows in `_a`
+            self._a += self.value * value
+            return self._a
+
+        def loop(self, n):
+            # Internal reads, never recorded
+            total = 0
+            for _ in range(n):
+                total += self.value + self._a
+            return total
+
+        @classmethod
+        def build(cls, value):
+            return value
+
+        @classmethod
+        def create(cls, value):
+            obj = cls()
+            obj.value = value
+            return obj
+
+        @staticmethod
+        def static(value):
+            return value
+
+        @property
+        def prop(self):
+            return self._a
+
+        @prop.setter
+        def prop(self, value):
+            self._a = value
+
+    for i in range(n_members):
+        setattr(Foo, f'method_{i}', lambda self: None)
+    return Foo
+
+
+def make_slotted_class():
+    """`make_class` reduced to what the attribute loops use, with `__slots__`."""
+
+    class Slotted:
+        __slots__ = ('_a', 'value')
+
+        def __init__(self, value=0):
+            self.value = value
+            self._a = 0
+
+        def loop(self, n):
+            total = 0
+            for _ in range(n):
+                total += self.value + self._a
+            return total
+
+    return Slotted
+
+
+def make_service():
+    """A request handler, with a synchronous and an awaited entry point."""
+
+    class Service:
+        def __init__(self):
+            self.served = 0
+
+        def handle(self, request, options):
+            self.served += 1
+            return {'request': request, 'options': options}
+
+        async def handle_async(self, value):
+            # One trip through the event loop, as a real I/O wait would
+            await asyncio.sleep(0)
+            self.served += 1
+            return [value]
+
+    return Service
+
+
+def make_module():
+    """A module of one function, for `FunctionHugger`."""
+    module = types.ModuleType('fakemod')
+    exec('def add(a, b):\n    return a + b\n', module.__dict__)
+    return module
+
+
+class Tracked:
+    """Weakly referenceable object to fill the symbol table with."""
+
+
+PACKAGE_CLASS = '''
+class {name}({base}):
+    def __init__(self, value=0):
+        self.value = value
+
+    @property
+    def size(self):
+        return self.value
+
+    @classmethod
+    def make(cls, value):
+        return cls(value)
+
+    @staticmethod
+    def check(value):
+        return value
+{methods}
+'''
+
+
+def write_package(root, name, n_modules, n_classes, n_members):
+    """Write the package `name` under `root`, `n_classes` classes of `n_members` + 4 members per module."""
+    package = os.path.join(root, name)
+    os.makedirs(package)
+    open(os.path.join(package, '__init__.py'), 'w').close()
+    methods = ''.join(f'\n    def method_{i}(self, x):\n        return x\n' for i in range(n_members))
+    for m in range(n_modules):
+        with open(os.path.join(package, f'module_{m}.py'), 'w') as fp:
+            for c in range(n_classes):
+                # Every other class derives from the previous one
+                base = f'Class_{c - 1}' if c % 2 else 'object'
+                fp.write(PACKAGE_CLASS.format(name=f'Class_{c}', base=base, methods=methods))
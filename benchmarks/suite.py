@@ -0,0 +1,684 @@
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+# Regression suite for the overhead of hugging, written as JSON so runs can be compared.
+#
+#   python -m benchmarks.suite run --output before.json
+#   python -m benchmarks.suite run --output after.json --compare before.json
+#   python -m benchmarks.suite run --quick --only operations registry
+#   python -m benchmarks.suite compare before.json after.json --threshold 0.15
+#
+# `run` measures every group of `GROUPS`, or only those given to `--only`: the cost of
+# each interception path and attribute mode against the plain class, makeScript time and
+# memory, the symbol table, detectors, functions, metrics, recording windows, creation,
+# hug_package, history memory, concurrent recording, loop compression, replay, the
+# optimizer passes (checked to leave the replayed state unchanged), awaited calls and
+# the background pipeline. `compare` flags every metric more than `threshold` slower
+# (or larger) than the baseline and exits with status 1 if there is one. Timings
+# are the best of several repeats, with the collector paused as `timeit` does. Plain
+# timings are kept under `reference`: they describe the machine, they are not compared.
+# The classes hugged are in `benchmarks.fixtures`.
+
+import argparse
+import asyncio
+import gc
+import importlib
+import json
+import multiprocessing
+import pkgutil
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+from benchmarks.fixtures import (Tracked, make_class, make_module, make_service, make_slotted_class,
+                                 write_package)
+from hugger import (ClassHugger, ConcurrentHistory, DepthCallDetector, FrameCallDetector, FunctionHugger,
+                    RecordingPipeline, RecordingPolicy, Replayer, StackCallDetector, optimize)
+
+# Statements timed for each interception path, `obj` is an instance and `Foo` its class
+OPERATIONS = {
+    'init': 'Foo(1)',
+    'method': 'obj.method(1)',
+    'classmethod': 'Foo.build(1)',
+    'staticmethod': 'Foo.static(1)',
+    'property_get': 'obj.prop',
+    'property_set': 'obj.prop = 1',
+    'attribute_get': 'obj.value',
+    'attribute_set': 'obj.value = 1',
+}
+ATTRIBUTE_MODES = ('getattribute', 'descriptor')
+
+# Attribute reads in tight loops, from outside the instance except for `internal_reads`
+ATTRIBUTE_LOOPS = {
+    'private_read': lambda obj, n: [obj._a for _ in range(n)],
+    'method_lookup': lambda obj, n: [obj.loop for _ in range(n)],
+    'internal_reads': lambda obj, n: obj.loop(n),
+    'public_read': lambda obj, n: [obj.value for _ in range(n)],
+}
+
+DETECTORS = {'stack': StackCallDetector, 'frame': FrameCallDetector, 'depth': DepthCallDetector}
+
+# `number` for recorded calls, `calls` for calls which are not recorded and so cheap
+FULL = {'number': 20000, 'calls': 200000, 'repeat': 5, 'history': (1000, 10000, 100000),
+        'objects': (1000, 10000, 100000), 'tracked': (10, 1000, 100000, 1000000), 'depths': (10, 100, 500),
+        'members': (1, 10, 100, 1000), 'package': (20, 25, 20), 'events': 10000000,
+        'traced_events': 100000, 'threads': (32, 1000, 200),
+        'steps': 100000, 'awaits': 100000, 'requests': 5000, 'burst': 100000}
+QUICK = {'number': 2000, 'calls': 20000, 'repeat': 3, 'history': (1000, 10000),
+         'objects': (1000, 10000), 'tracked': (10, 10000), 'depths': (10, 100),
+         'members': (1, 100), 'package': (5, 10, 10), 'events': 300000,
+         'traced_events': 30000, 'threads': (8, 100, 50),
+         'steps': 10000, 'awaits': 10000, 'requests': 1000, 'burst': 20000}
+
+
+def per_operation(statement, namespace, number, repeat):
+    timer = timeit.Timer(statement, globals=namespace)
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e9
+
+
+def per_call(fun, number, repeat):
+    return min(timeit.repeat(fun, number=number, repeat=repeat)) / number * 1e9
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def measure_operations(settings, results, reference):
+    number, repeat = settings['number'], settings['repeat']
+    for name, statement in OPERATIONS.items():
+        klass = make_class()
+        reference[f'operations.{name}.plain_ns'] = per_operation(
+            statement, {'Foo': klass, 'obj': klass(1)}, number, repeat)
+    for mode in ATTRIBUTE_MODES:
+        for name, statement in OPERATIONS.items():
+            # A fresh hugger per operation, so the history does not build up across them
+            hugger = ClassHugger(attributes=mode)
+            klass = hugger.hug(make_class())
+            hugged = per_operation(statement, {'Foo': klass, 'obj': klass(1)}, number, repeat)
+            results[f'operations.{mode}.{name}.hugged_ns'] = hugged
+            reference[f'operations.{mode}.{name}.ratio'] = hugged / reference[f'operations.{name}.plain_ns']
+
+
+def record_history(n_events):
+    hugger = ClassHugger(attributes='descriptor')
+    klass = hugger.hug(make_class())
+    objs = [klass(i) for i in range(10)]
+    data = [[i] for i in range(10)]
+    while len(hugger._history) < n_events:
+        i = len(hugger._history)
+        obj = objs[i % 10]
+        obj.method(data[i % 10], scale=2)
+        obj.pair(i)
+        obj.prop = i
+        obj.value = objs[(i + 1) % 10]
+        klass.build(i)
+    return hugger
+
+
+def measure_scripts(settings, results, reference):
+    for n_events in settings['history']:
+        hugger = record_history(n_events)
+        n = len(hugger._history)
+        best = float('inf')
+        for _ in range(settings['repeat']):
+            start = time.perf_counter()
+            script = hugger.makeScript()
+            best = min(best, time.perf_counter() - start)
+        tracemalloc.start()
+        hugger.makeScript()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[f'script.{n_events}.ns_per_event'] = best / n * 1e9
+        results[f'script.{n_events}.peak_bytes_per_event'] = peak / n
+        reference[f'script.{n_events}.events'] = n
+        reference[f'script.{n_events}.script_bytes'] = len(script)
+
+
+def measure_objects(settings, results, reference):
+    for n_objects in settings['objects']:
+        hugger = ClassHugger(attributes='descriptor')
+        klass = hugger.hug(make_class())
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            objs = [klass(i) for i in range(n_objects)]
+            created = time.perf_counter() - start
+            start = time.perf_counter()
+            for obj in objs:
+                obj.method(1)
+            called = time.perf_counter() - start
+        finally:
+            if enabled:
+                gc.enable()
+        results[f'objects.{n_objects}.init_ns'] = created / n_objects * 1e9
+        results[f'objects.{n_objects}.method_ns'] = called / n_objects * 1e9
+        reference[f'objects.{n_objects}.tracked'] = len(hugger._create_list)
+
+
+def measure_attributes(settings, results, reference):
+    n, repeat = settings['number'], settings['repeat']
+    for kind, make in (('dict', make_class), ('slots', make_slotted_class)):
+        plain = make()()
+        for name, loop in ATTRIBUTE_LOOPS.items():
+            reference[f'attributes.{kind}.{name}.plain_ns'] = per_call(lambda: loop(plain, n), 1, repeat) / n
+        for mode in ATTRIBUTE_MODES:
+            obj = ClassHugger(attributes=mode).hug(make())()
+            for name, loop in ATTRIBUTE_LOOPS.items():
+                results[f'attributes.{kind}.{mode}.{name}_ns'] = per_call(lambda: loop(obj, n), 1, repeat) / n
+
+
+def measure_registry(settings, results, reference):
+    for n_tracked in settings['tracked']:
+        hugger = ClassHugger()
+        obj = hugger.hug(make_class())()
+        # Real objects, kept alive, so the lookups the wrapper makes see a full symbol table
+        tracked = [Tracked() for _ in range(n_tracked)]
+        for value in tracked:
+            hugger._track_var(value)
+        arg = []
+        fn = obj.method
+        results[f'registry.{n_tracked}.call_ns'] = per_call(lambda: fn(arg), settings['number'], settings['repeat'])
+        reference[f'registry.{n_tracked}.symbols'] = len(hugger._symbols)
+
+
+def at_depth(depth, fun):
+    if depth <= 1:
+        return fun()
+    return at_depth(depth - 1, fun)
+
+
+def measure_detection(settings, results, reference):
+    # Deep stacks make the stack walking detectors slow, fewer calls keep the group short
+    number, repeat = settings['number'] // 10, settings['repeat']
+    for depth in settings['depths']:
+        plain = make_class()()
+        reference[f'detection.{depth}.plain_ns'] = at_depth(
+            depth, lambda: per_call(lambda: plain.method(1), number, repeat))
+        for name, detector in DETECTORS.items():
+            fn = ClassHugger(detector=detector()).hug(make_class())().method
+            results[f'detection.{depth}.{name}_ns'] = at_depth(depth, lambda: per_call(lambda: fn(1), number, repeat))
+
+
+def measure_functions(settings, results, reference):
+    module = make_module()
+    calls, repeat = settings['calls'], settings['repeat']
+    reference['functions.plain_ns'] = per_call(lambda: module.add(1, 2), calls, repeat)
+    hugger = FunctionHugger()
+    hugger.hug_module(module)
+    results['functions.enabled_ns'] = per_call(lambda: module.add(1, 2), settings['number'], repeat)
+    hugger.disable()
+    results['functions.disabled_ns'] = per_call(lambda: module.add(1, 2), calls, repeat)
+
+
+def measure_metrics(settings, results, reference):
+    for metrics in (False, True):
+        # Nothing is recorded, so only the wrapper and the metrics are measured
+        hugger = ClassHugger(metrics=metrics, policy=RecordingPolicy(sample_rate=0), attributes='descriptor')
+        obj = hugger.hug(make_class())()
+        key = 'with' if metrics else 'without'
+        results[f'metrics.{key}_ns'] = per_call(lambda: obj.method(1), settings['calls'], settings['repeat'])
+
+
+def measure_windows(settings, results, reference):
+    calls, repeat = settings['calls'], settings['repeat']
+    plain = make_class(20)()
+    reference['windows.plain_ns'] = per_call(lambda: plain.method(1), calls, repeat)
+    hugger = ClassHugger(attributes='descriptor')
+    obj = hugger.hug(make_class(20))()
+    results['windows.inside_ns'] = per_call(lambda: obj.method(1), settings['number'], repeat)
+    hugger.disable()
+    results['windows.outside_ns'] = per_call(lambda: obj.method(1), calls, repeat)
+
+    def window():
+        with hugger.recording():
+            pass
+
+    results['windows.open_close_ns'] = per_call(window, settings['number'], repeat)
+
+
+def measure_creation(settings, results, reference):
+    number, repeat = settings['number'], settings['repeat']
+    for n_members in settings['members']:
+        reference[f'creation.{n_members}.plain_ns'] = per_call(make_class(n_members), number, repeat)
+        hugger = ClassHugger(attributes='descriptor')
+        results[f'creation.{n_members}.hugged_ns'] = per_call(hugger.hug(make_class(n_members)), number, repeat)
+
+
+def timed_import(name, hug):
+    start = time.perf_counter()
+    package = importlib.import_module(name)
+    for info in pkgutil.walk_packages(package.__path__, f'{name}.'):
+        importlib.import_module(info.name)
+    imported = time.perf_counter()
+    classes = ClassHugger(attributes='descriptor').hug_package(package) if hug else []
+    end = time.perf_counter()
+    for module in [key for key in sys.modules if key == name or key.startswith(f'{name}.')]:
+        del sys.modules[module]
+    return imported - start, end - imported, len(classes)
+
+
+def measure_startup(settings, results, reference):
+    n_modules, n_classes, n_members = settings['package']
+    dont_write_bytecode = sys.dont_write_bytecode
+    with tempfile.TemporaryDirectory() as root:
+        write_package(root, 'fakepkg', n_modules, n_classes, n_members)
+        sys.path.insert(0, root)
+        sys.dont_write_bytecode = True
+        try:
+            import_only, _, _ = timed_import('fakepkg', False)
+            _, hug_time, n = timed_import('fakepkg', True)
+        finally:
+            sys.path.remove(root)
+            sys.dont_write_bytecode = dont_write_bytecode
+    reference['startup.import_ns'] = import_only * 1e9
+    reference['startup.classes'] = n
+    results['startup.hug_ns_per_class'] = hug_time / n * 1e9
+
+
+def record_calls(n_events):
+    """A hugger which recorded `n_events` calls, attribute sets and gets through its wrappers."""
+    hugger = ClassHugger(attributes='descriptor')
+    klass = hugger.hug(make_class())
+    objs = [klass(i) for i in range(10)]
+    data = [[i] for i in range(10)]
+    for i in range(n_events // 3):
+        obj = objs[i % 10]
+        obj.method(data[i % 10], i)
+        obj.value = i
+        obj.value
+    return hugger
+
+
+def history_rss(n_events):
+    """Peak RSS growth per event and time per event of `record_calls`, in a fresh interpreter.
+
+    The peak RSS of the suite's own process belongs to whichever group came before.
+    """
+    # kB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    hugger = record_calls(n_events)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    n = len(hugger._history)
+    return (after - before) * scale / n, elapsed / n * 1e9, n
+
+
+def measure_history(settings, results, reference):
+    tracemalloc.start()
+    hugger = record_calls(settings['traced_events'])
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    results['history.traced_bytes_per_event'] = current / len(hugger._history)
+    del hugger
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        rss, elapsed, n = pool.apply(history_rss, (settings['events'],))
+    results['history.rss_bytes_per_event'] = rss
+    results['history.record_ns_per_event'] = elapsed
+    reference['history.events'] = n
+
+
+def measure_concurrency(settings, results, reference):
+    n_threads, n_tasks, n_calls = settings['threads']
+
+    def worker(klass):
+        obj = klass.create(1)
+        for i in range(n_calls):
+            obj.method(i)
+            obj.pair(i)
+            obj.value = i
+
+    async def task(klass):
+        obj = klass(2)
+        for i in range(n_calls // 10):
+            obj.method(i)
+            await asyncio.sleep(0)
+            obj.value = i
+
+    async def tasks(klass):
+        await asyncio.gather(*(task(klass) for _ in range(n_tasks)))
+
+    hugger = ClassHugger(history=ConcurrentHistory())
+    klass = hugger.hug(make_class())
+    threads = [threading.Thread(target=worker, args=(klass,)) for _ in range(n_threads)]
+    threads.append(threading.Thread(target=asyncio.run, args=(tasks(klass),)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    expected = n_threads * (1 + 3 * n_calls) + n_tasks * (1 + 2 * (n_calls // 10))
+    recorded = len(hugger._history)
+    if recorded != expected:
+        raise AssertionError(f'{recorded} events recorded from threads and tasks, {expected} expected')
+    # The script has to replay against the real class
+    exec(compile(hugger.makeScript(), '<hugged>', 'exec'), {'Foo': make_class()}, {})
+    results['concurrency.ns_per_event'] = elapsed / recorded * 1e9
+    reference['concurrency.events'] = recorded
+
+
+def replay_time(script, klass):
+    start = time.perf_counter()
+    exec(compile(script, '<script>', 'exec'), {'Foo': klass})
+    return time.perf_counter() - start
+
+
+def measure_loops(settings, results, reference):
+    n_steps = settings['steps']
+    hugger = ClassHugger(attributes='descriptor')
+    obj = hugger.hug(make_class())()
+    for i in range(n_steps):
+        obj.step(i, scale=0.5)
+    unrolled = hugger.makeScript()
+    looped = hugger.makeScript(optimize(hugger.history, passes=('loops',)))
+    for name, script in (('unrolled', unrolled), ('looped', looped)):
+        results[f'loops.{name}.bytes_per_step'] = len(script) / n_steps
+        results[f'loops.{name}.exec_ns_per_step'] = replay_time(script, make_class()) / n_steps * 1e9
+
+
+def measure_replay(settings, results, reference):
+    hugger = ClassHugger(attributes='descriptor')
+    obj = hugger.hug(make_class())()
+    for i in range(settings['steps'] // 3):
+        obj.step(i)
+        obj.value = i
+        obj.prop
+    n = len(hugger.history)
+    results['replay.script_exec_ns_per_event'] = replay_time(hugger.makeScript(), make_class()) / n * 1e9
+
+    start = time.perf_counter()
+    replayer = Replayer(hugger.history, {'Foo': make_class()})
+    compiled = time.perf_counter() - start
+    replayer.run()
+    replayed = time.perf_counter() - start
+    results['replay.compile_ns_per_event'] = compiled / n * 1e9
+    results['replay.run_ns_per_event'] = replayed / n * 1e9
+
+    replayer = Replayer(hugger.history, {'Foo': make_class()})
+    replayer.run(timing=True)
+    reference['replay.step_p50_ns'] = percentile(replayer.timings, 50)
+    reference['replay.step_p99_ns'] = percentile(replayer.timings, 99)
+
+
+def record_redundant(n_rounds):
+    """A hugger whose history gives every `optimize` pass something to remove."""
+    hugger = ClassHugger(attributes='descriptor')
+    klass = hugger.hug(make_class())
+    first, second = klass(1), klass(2)
+    for i in range(n_rounds):
+        # A dead store, then gets which are unused or of a known literal
+        first.value = i
+        first.value = i + 1
+        first.value
+        second.prop = first.prop
+        # A set the next call reads, which has to stay
+        second.value = i
+        second.accumulate(i)
+        first.step(i, scale=0.5)
+    for i in range(10):
+        first.step(i)
+    return hugger, {'foo_0': first, 'foo_1': second}
+
+
+def final_state(history, objects):
+    replayer = Replayer(history, {'Foo': make_class()})
+    replayer.run()
+    return {name: vars(replayer.symbols[name]) for name in objects}
+
+
+def measure_optimizer(settings, results, reference):
+    hugger, objects = record_redundant(settings['steps'] // 6)
+    history = hugger.history
+    start = time.perf_counter()
+    optimized = optimize(history)
+    elapsed = time.perf_counter() - start
+    # The passes may only drop events whose effect nothing observes
+    state = final_state(history, objects)
+    if final_state(optimized, objects) != state:
+        raise AssertionError('replaying the optimized history ends in another state than the recorded one')
+    if state != {name: vars(obj) for name, obj in objects.items()}:
+        raise AssertionError('replaying the recorded history ends in another state than the session')
+    results['optimizer.ns_per_event'] = elapsed / len(history) * 1e9
+    reference['optimizer.events'] = len(history)
+    reference['optimizer.remaining'] = len(optimized)
+    for name, removed in optimized.report.items():
+        reference[f'optimizer.{name}.removed'] = removed
+
+
+async def serve(service, n_calls):
+    start = time.perf_counter()
+    await asyncio.gather(*(service.handle_async(i) for i in range(n_calls)))
+    return time.perf_counter() - start
+
+
+def measure_awaits(settings, results, reference):
+    n_calls, repeat = settings['awaits'], settings['repeat']
+
+    def best(hug, collect=True):
+        timings = []
+        for _ in range(repeat):
+            service = (ClassHugger(attributes='descriptor').hug(make_service()) if hug else make_service())()
+            if not collect:
+                gc.disable()
+            try:
+                timings.append(asyncio.run(serve(service, n_calls)))
+            finally:
+                gc.enable()
+        return min(timings) / n_calls * 1e9
+
+    reference['awaits.plain_ns'] = best(False)
+    results['awaits.hugged_ns'] = best(True)
+    # The recorded results are lists, which are kept alive by the hugger; most of the
+    # overhead is the collector walking them, see the same run with collection paused
+    results['awaits.hugged_no_gc_ns'] = best(True, collect=False)
+    hugger = ClassHugger(attributes='descriptor')
+    asyncio.run(serve(hugger.hug(make_service())(), n_calls))
+    start = time.perf_counter()
+    hugger.makeScript()
+    results['awaits.script_ns_per_event'] = (time.perf_counter() - start) / len(hugger.history) * 1e9
+
+
+def request_loop(service, n_requests, wait=0.0002):
+    latencies = []
+    for i in range(n_requests):
+        start = time.perf_counter_ns()
+        service.handle(i, [i])
+        latencies.append(time.perf_counter_ns() - start)
+        # The worker catches up while the request path waits on I/O
+        time.sleep(wait)
+    return latencies
+
+
+def burst(service, n_calls):
+    start = time.perf_counter()
+    for i in range(n_calls):
+        service.handle(i, [i])
+    return time.perf_counter() - start
+
+
+def measure_pipeline(settings, results, reference):
+    n_requests, n_calls = settings['requests'], settings['burst']
+    latencies = request_loop(make_service()(), n_requests)
+    reference['pipeline.plain.p50_ns'] = percentile(latencies, 50)
+    reference['pipeline.plain.p99_ns'] = percentile(latencies, 99)
+    for name, background in (('inline', None), ('background', True)):
+        hugger = ClassHugger(attributes='descriptor', background=background)
+        latencies = request_loop(hugger.hug(make_service())(), n_requests)
+        results[f'pipeline.{name}.p50_ns'] = percentile(latencies, 50)
+        results[f'pipeline.{name}.p99_ns'] = percentile(latencies, 99)
+        if hugger.pipeline is not None:
+            hugger.pipeline.close()
+
+    # A burst the worker cannot keep up with, on a queue of a tenth of it
+    hugger = ClassHugger(attributes='descriptor')
+    results['pipeline.burst.inline_ns'] = burst(hugger.hug(make_service())(), n_calls) / n_calls * 1e9
+    for mode in ('block', 'drop', 'sample'):
+        pipeline = RecordingPipeline(maxsize=n_calls // 10, backpressure=mode)
+        hugger = ClassHugger(attributes='descriptor', background=pipeline)
+        elapsed = burst(hugger.hug(make_service())(), n_calls)
+        start = time.perf_counter()
+        hugger.flush()
+        drained = time.perf_counter() - start
+        results[f'pipeline.burst.{mode}_ns'] = elapsed / n_calls * 1e9
+        reference[f'pipeline.burst.{mode}.drain_ns'] = drained * 1e9
+        reference[f'pipeline.burst.{mode}.dropped'] = pipeline.dropped
+        pipeline.close()
+
+
+GROUPS = {
+    'operations': measure_operations,
+    'script': measure_scripts,
+    'objects': measure_objects,
+    'attributes': measure_attributes,
+    'registry': measure_registry,
+    'detection': measure_detection,
+    'functions': measure_functions,
+    'metrics': measure_metrics,
+    'windows': measure_windows,
+    'creation': measure_creation,
+    'startup': measure_startup,
+    'history': measure_history,
+    'concurrency': measure_concurrency,
+    'loops': measure_loops,
+    'replay': measure_replay,
+    'optimizer': measure_optimizer,
+    'awaits': measure_awaits,
+    'pipeline': measure_pipeline,
+}
+
+
+def run(quick=False, groups=None):
+    settings = QUICK if quick else FULL
+    groups = list(GROUPS) if groups is None else groups
+    results = {}
+    reference = {}
+    for group in groups:
+        GROUPS[group](settings, results, reference)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'quick': quick,
+            'groups': groups,
+        },
+        'metrics': results,
+        'reference': reference,
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """Metrics of `current` more than `threshold` (a fraction) above `baseline`, as
+    (name, baseline value, current value, relative change), worst first."""
+    regressions = []
+    for name, value in current['metrics'].items():
+        before = baseline['metrics'].get(name)
+        if not before:
+            continue
+        change = value / before - 1
+        if change > threshold:
+            regressions.append((name, before, value, change))
+    return sorted(regressions, key=lambda item: -item[3])
+
+
+def print_results(report, fp=sys.stdout):
+    metrics = report['metrics']
+    reference = report['reference']
+    groups = report['meta'].get('groups', ['operations', 'script', 'objects'])
+    if 'operations' in groups:
+        fp.write(f'{"operation":<16}{"plain (ns)":>12}' + ''.join(f'{mode:>26}' for mode in ATTRIBUTE_MODES) + '\n')
+        for name in OPERATIONS:
+            row = f'{name:<16}{reference[f"operations.{name}.plain_ns"]:>12.1f}'
+            for mode in ATTRIBUTE_MODES:
+                hugged = metrics[f'operations.{mode}.{name}.hugged_ns']
+                row += f'{hugged:>16.1f} ({reference[f"operations.{mode}.{name}.ratio"]:6.1f}x)'
+            fp.write(row + '\n')
+    if 'script' in groups:
+        fp.write(f'\n{"events":<16}{"script ns/event":>18}{"peak bytes/event":>18}\n')
+        for key in sorted((key for key in metrics if key.endswith('.ns_per_event') and key.startswith('script.')),
+                          key=lambda k: int(k.split('.')[1])):
+            n = key.split('.')[1]
+            fp.write(f'{n:<16}{metrics[key]:>18.1f}{metrics[f"script.{n}.peak_bytes_per_event"]:>18.1f}\n')
+    if 'objects' in groups:
+        fp.write(f'\n{"objects":<16}{"init ns":>18}{"method ns":>18}\n')
+        for key in sorted((key for key in metrics if key.endswith('.init_ns') and key.startswith('objects.')),
+                          key=lambda k: int(k.split('.')[1])):
+            n = key.split('.')[1]
+            fp.write(f'{n:<16}{metrics[key]:>18.1f}{metrics[f"objects.{n}.method_ns"]:>18.1f}\n')
+    # The other groups as they come, compared metrics first then their reference values
+    for group in groups:
+        if group in ('operations', 'script', 'objects'):
+            continue
+        fp.write(f'\n{group}\n')
+        prefix = f'{group}.'
+        for values, note in ((metrics, ''), (reference, '  (reference)')):
+            for key, value in values.items():
+                if key.startswith(prefix):
+                    fp.write(f'  {key[len(prefix):]:<40}{value:>16.1f}{note}\n')
+
+
+def print_regressions(regressions, threshold, fp=sys.stdout):
+    if not regressions:
+        fp.write(f'\nno regressions beyond {threshold:.0%}\n')
+        return
+    fp.write(f'\n{len(regressions)} regression(s) beyond {threshold:.0%}:\n')
+    for name, before, after, change in regressions:
+        fp.write(f'  {name:<48}{before:>14.1f} -> {after:>14.1f}  (+{change:.0%})\n')
+
+
+def load(path):
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite', description='Hugger overhead benchmarks.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the suite and write the results as JSON')
+    run_parser.add_argument('--output', default='hugger-benchmarks.json', help='JSON file to write')
+    run_parser.add_argument('--quick', action='store_true', help='fewer iterations and smaller sizes')
+    run_parser.add_argument('--only', nargs='+', choices=list(GROUPS), metavar='GROUP',
+                            help=f'run only these groups: {", ".join(GROUPS)}')
+    run_parser.add_argument('--compare', metavar='BASELINE', help='compare the results against a JSON file')
+    run_parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown flagged (0.1 = 10%%)')
+    compare_parser = commands.add_parser('compare', help='compare two JSON result files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown flagged (0.1 = 10%%)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args.quick, args.only)
+        with open(args.output, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+        print_results(report)
+        print(f'\nresults written to {args.output}')
+        if args.compare is None:
+            return 0
+        baseline = load(args.compare)
+    else:
+        baseline = load(args.baseline)
+        report = load(args.current)
+    regressions = compare(baseline, report, args.threshold)
+    print_regressions(regressions, args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
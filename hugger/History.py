@@ -0,0 +1,245 @@
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+import heapq
+import itertools
+import marshal
+import os
+import pickle
+import struct
+import threading
+
+from array import array
+from collections import deque
+
+from hugger.Hugger import CallType, HistoryEntry, Symbol
+
+_LENGTH = struct.Struct('<I')
+_MARSHAL = 0
+_PICKLE = 1
+
+SEGMENT_MAGIC = b'HUGSEG1\n'
+
+
+def _symbol_mask(values):
+    mask = 0
+    for i, value in enumerate(values):
+        if isinstance(value, Symbol):
+            mask |= 1 << i
+    return mask
+
+
+def _plain(value):
+    # marshal only accepts exact builtin types
+    return str(value) if isinstance(value, Symbol) else value
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False
+    return True
+
+
+def encode_entry(entry) -> bytes:
+    """Encode a `HistoryEntry` as a self contained byte string.
+
+    Literals which cannot be pickled are stored as their script text, as a symbol, so
+    the script made from the decoded entry is unchanged.
+    """
+    try:
+        return _encode(entry.args, entry.kwargs, entry)
+    except Exception:
+        args = tuple(arg if _picklable(arg) else Symbol(f'{arg}') for arg in entry.args)
+        kwargs = entry.kwargs
+        if kwargs:
+            kwargs = {key: item if _picklable(item) else Symbol(f'{item}') for key, item in kwargs.items()}
+        return _encode(args, kwargs, entry)
+
+
+def _encode(args, kwargs, entry):
+    kwargs = kwargs or {}
+    mask = _symbol_mask((*args, *kwargs.values()))
+    record = (entry.class_obj, int(entry.call_type), _plain(entry.call_obj), entry.member,
+              tuple(_plain(arg) for arg in args),
+              {key: _plain(item) for key, item in kwargs.items()} if kwargs else None,
+              tuple(str(ret) for ret in entry.returns), mask)
+    try:
+        return bytes((_MARSHAL,)) + marshal.dumps(record)
+    except ValueError:
+        # Literals which are not builtin containers, e.g. tuples holding arbitrary objects
+        return bytes((_PICKLE,)) + pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_entry(data) -> HistoryEntry:
+    """Inverse of `encode_entry`."""
+    payload = bytes(data[1:])
+    if data[0] == _MARSHAL:
+        record = marshal.loads(payload)
+    else:
+        record = pickle.loads(payload)
+    class_obj, call_type, call_obj, member, args, kwargs, returns, mask = record
+    if mask:
+        n_args = len(args)
+        args = tuple(Symbol(arg) if mask >> i & 1 else arg for i, arg in enumerate(args))
+        if kwargs:
+            kwargs = {key: Symbol(item) if mask >> (n_args + i) & 1 else item
+                      for i, (key, item) in enumerate(kwargs.items())}
+    return HistoryEntry(class_obj, CallType(call_type), None if call_obj is None else Symbol(call_obj), member,
+                        args, kwargs, tuple(Symbol(ret) for ret in returns))
+
+
+def write_records(fp, entries):
+    """Write `entries` to the binary stream `fp` as length-prefixed records."""
+    for entry in entries:
+        data = encode_entry(entry)
+        fp.write(_LENGTH.pack(len(data)))
+        fp.write(data)
+
+
+def read_records(fp):
+    """Yield the entries of a stream written by `write_records`."""
+    size = _LENGTH.size
+    while True:
+        header = fp.read(size)
+        if len(header) < size:
+            return
+        length, = _LENGTH.unpack(header)
+        yield decode_entry(fp.read(length))
+
+
+class RingHistory(deque):
+    """Keep only the last `maxlen` events, older ones are discarded."""
+
+    def __init__(self, maxlen):
+        super().__init__(maxlen=maxlen)
+
+
+class ConcurrentHistory:
+    """History for hugged objects used from several threads or asyncio tasks.
+
+    Every thread appends to its own buffer, stamping entries with a sequence number from
+    a shared atomic counter, so recording takes no lock. Iterating merges the buffers
+    back into global sequence order. asyncio tasks share their loop's thread buffer.
+    """
+
+    def __init__(self):
+        self._sequence = itertools.count()
+        self._local = threading.local()
+        self._buffers = []
+        self._lock = threading.Lock()
+
+    def _buffer(self):
+        try:
+            return self._local.buffer
+        except AttributeError:
+            # First event of this thread, the only time the lock is taken
+            buffer = self._local.buffer = (array('Q'), [])
+            with self._lock:
+                self._buffers.append(buffer)
+            return buffer
+
+    def append(self, entry):
+        sequence, entries = self._buffer()
+        sequence.append(next(self._sequence))
+        entries.append(entry)
+
+    def __iter__(self):
+        with self._lock:
+            buffers = list(self._buffers)
+        # Snapshot each buffer, other threads may keep recording while we merge
+        streams = []
+        for sequence, entries in buffers:
+            n = min(len(sequence), len(entries))
+            streams.append(zip(sequence[:n], entries[:n]))
+        for _, entry in heapq.merge(*streams, key=lambda item: item[0]):
+            yield entry
+
+    def __len__(self):
+        return sum(len(entries) for _, entries in list(self._buffers))
+
+
+class SegmentedHistory:
+    """Keep `segment_size` events in memory and spill full segments to `directory`.
+
+    Memory is bounded by one segment regardless of session length. If `max_segments`
+    is given the oldest segment files are deleted once there are more than that many.
+    Iterating reads the spilled segments back in order, followed by the in-memory tail.
+    A spill which fails (e.g. a full disk) never raises into the recorded call: it is
+    counted in `errors` and retried once another segment worth of events has come in.
+    """
+
+    def __init__(self, directory, segment_size=100000, max_segments=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self.segments = []
+        self._sizes = []
+        self._next_segment = 0
+        self._buffer = []
+        self._spill_at = segment_size
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, entry):
+        if len(self._buffer) >= self._spill_at:
+            try:
+                self.spill()
+            except Exception:
+                self.errors += 1
+                self._spill_at = len(self._buffer) + self.segment_size
+        self._buffer.append(entry)
+
+    def spill(self):
+        """Write the in-memory events to a new segment file."""
+        if not self._buffer:
+            return
+        path = os.path.join(self.directory, f'segment_{self._next_segment:06d}.hug')
+        # Write then rename, a failed spill leaves no partial segment behind
+        temp = f'{path}.tmp'
+        try:
+            with open(temp, 'wb') as fp:
+                fp.write(SEGMENT_MAGIC)
+                write_records(fp, self._buffer)
+            os.replace(temp, path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        self._next_segment += 1
+        self.segments.append(path)
+        self._sizes.append(len(self._buffer))
+        self._buffer = []
+        self._spill_at = self.segment_size
+        if self.max_segments is not None:
+            while len(self.segments) > self.max_segments:
+                os.remove(self.segments.pop(0))
+                self._sizes.pop(0)
+
+    def __iter__(self):
+        for path in list(self.segments):
+            yield from read_segment(path)
+        yield from list(self._buffer)
+
+    def __len__(self):
+        return sum(self._sizes) + len(self._buffer)
+
+
+def read_segment(path):
+    """Yield the entries stored in one segment file."""
+    with open(path, 'rb') as fp:
+        if fp.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f'{path} is not a hugger segment file')
+        yield from read_records(fp)
+
+
+def read_segments(directory):
+    """Yield the entries of every segment file in `directory`, oldest first."""
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('segment_') and name.endswith('.hug'):
+            yield from read_segment(os.path.join(directory, name))
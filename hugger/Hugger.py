@@ -5,67 +5,667 @@
 __author__ = 'github.com/wardsimon'
 __version__ = '0.0.4'
 
+import contextvars
+import fnmatch
+import gc
+import importlib
 import inspect
+import itertools
+import pkgutil
+import random
+import re
 import sys
+import threading
+import types
+import weakref
 
-from functools import wraps
-from typing import Callable
+from collections import OrderedDict
+from contextlib import contextmanager
+from enum import IntEnum
+
+from hugger.Metrics import Metrics
+from hugger.Pipeline import RecordingPipeline
+from hugger.Values import ValueStore
+
+
+class IdentityRegistry:
+    """Ordered set of object ids with O(1) membership and stable slot indices.
+
+    `append`, `index`, `in`, `len` and iteration behave as they would on a list of
+    unique ids. Slot indices come from an atomic counter, so `reserve` can hand out
+    unbound slots from several threads without a lock.
+    """
+
+    __slots__ = ('_index', '_ids', '_slots')
+
+    def __init__(self):
+        self._index = {}
+        self._ids = {}
+        self._slots = itertools.count()
+
+    def append(self, obj_id) -> int:
+        """Register `obj_id` and return its slot index (existing ids keep theirs)."""
+        index = self._index.get(obj_id)
+        if index is None:
+            index = next(self._slots)
+            self._index[obj_id] = index
+            self._ids[index] = obj_id
+        return index
+
+    def discard(self, obj_id):
+        """Forget `obj_id`, its slot index is never handed out again."""
+        index = self._index.pop(obj_id, None)
+        if index is not None:
+            self._ids.pop(index, None)
+
+    def bind(self, obj_id, index):
+        """Register `obj_id` under the slot `index` handed out by `reserve`."""
+        self._index[obj_id] = index
+        self._ids[index] = obj_id
+
+    def reserve(self) -> int:
+        """Allocate a slot index which is not bound to any object id."""
+        return next(self._slots)
+
+    def index(self, obj_id) -> int:
+        try:
+            return self._index[obj_id]
+        except KeyError:
+            raise ValueError(f'{obj_id} is not registered') from None
+
+    def get(self, obj_id, default=None):
+        return self._index.get(obj_id, default)
+
+    def __contains__(self, obj_id):
+        try:
+            return obj_id in self._index
+        except TypeError:
+            # Unhashable values can never have been registered
+            return False
+
+    def __getitem__(self, index):
+        """The id bound to slot `index`, None for reserved slots."""
+        return self._ids.get(index)
+
+    def __iter__(self):
+        return iter(self._ids.values())
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class CallType(IntEnum):
+    CREATE_OBJ = 0
+    FN_CALL = 1
+    PROP_SET = 2
+    PROP_GET = 3
+    MAGIC_METHOD = 4
+    FUNCTION = 5
+    LOAD_VALUE = 6
+    AWAIT = 7
+
+
+_SCALARS = (int, float, complex, str, bytes, type(None))
+_SCALAR_TYPES = frozenset((*_SCALARS, bool))
+
+
+def _is_literal(value):
+    """Whether `value` is stored by value: a scalar, or a tuple/frozenset of literals only.
+
+    Only the type is looked at, `isinstance` would read `__class__` through the hugged
+    `__getattribute__` of instances.
+    """
+    kind = type(value)
+    if kind in _SCALAR_TYPES:
+        return True
+    if kind is tuple or kind is frozenset:
+        return all(_is_literal(item) for item in value)
+    if issubclass(kind, _SCALARS):
+        return True
+    if issubclass(kind, (tuple, frozenset)):
+        return all(_is_literal(item) for item in value)
+    return False
+
+
+class Symbol(str):
+    """Name of a tracked object in the generated script, as opposed to a string literal."""
+
+    __slots__ = ()
+
+
+class HistoryEntry:
+    """A single intercepted event.
+
+    Tracked objects are stored as their `Symbol`, never as the objects themselves, so
+    recording does not keep arguments alive. Only immutable literals are kept by value.
+    Class and member names are interned and empty fields share the same `()`/None,
+    which puts a typical entry at roughly 250 bytes including its argument and return
+    tuples (`python -m benchmarks.suite run --only history`).
+    """
+
+    __slots__ = ('class_obj', 'call_type', 'call_obj', 'member', 'args', 'kwargs', 'returns')
+
+    def __init__(self, class_obj, call_type, call_obj=None, member=None, args=(), kwargs=None, returns=()):
+        self.class_obj = class_obj
+        self.call_type = call_type
+        self.call_obj = call_obj
+        self.member = member
+        self.args = args
+        self.kwargs = kwargs
+        self.returns = returns
+
+    def __repr__(self):
+        return f'HistoryEntry({self.class_obj}, {self.call_type.name}, {self.call_obj}, {self.member}, ' \
+               f'{self.args}, {self.kwargs}, {self.returns})'
+
+
+class Loop:
+    """A run of `count` repetitions of `body` which only differ in literal arguments.
+
+    Body entries refer to the loop variables `names` where their literals vary, the
+    values of each variable per repetition are in `columns`. Made by
+    `hugger.Optimizer.compress_loops`, it only exists in histories made for scripts.
+    """
+
+    __slots__ = ('body', 'names', 'columns', 'count')
+    call_type = None
+    returns = ()
+
+    def __init__(self, body, names, columns, count):
+        self.body = body
+        self.names = names
+        self.columns = columns
+        self.count = count
+
+    def __repr__(self):
+        return f'Loop({self.count} x {self.body}, {self.names})'
+
+
+def _awaits(entry):
+    """Whether `entry`, or the body of a `Loop`, awaits and so only runs inside a coroutine."""
+    if entry.call_type is None:
+        return any(_awaits(item) for item in entry.body)
+    return entry.call_type is CallType.AWAIT
+
+
+class CallDetector:
+    """Decides whether an intercepted call was made from inside the hugged class.
+
+    Calls made by the class itself are executed but not recorded. A detector is
+    bound once per hugged class, may wrap the original members with `guard` and is
+    then asked `is_internal()` from the wrapper, before the wrapped member runs.
+    """
+
+    def bind(self, klass):
+        return self
+
+    def join(self, klass):
+        """Share this bound detector with `klass`, e.g. a subclass hugged after its base."""
+        return self
+
+    def guard(self, fun):
+        return fun
+
+    def guard_async(self, fun):
+        """`guard` for coroutine functions, whose body only runs once the call is awaited."""
+        return fun
+
+    def is_internal(self, extra=0):
+        """`extra` counts frames between the wrapper and the detector call, e.g. helpers."""
+        return False
+
+
+class DepthCallDetector(CallDetector):
+    """Per-thread re-entrancy counter, constant time regardless of stack depth.
+
+    Coroutines of one thread interleave, so inside awaited members the depth is kept per
+    asyncio task instead, in a context variable.
+    """
+
+    class _Depth(threading.local):
+        depth = 0
+
+    def __init__(self):
+        self._local = self._Depth()
+        self._awaiting = contextvars.ContextVar('hugger_depth', default=0)
+        self._async = False
+
+    def bind(self, klass):
+        return DepthCallDetector()
+
+    def guard(self, fun):
+        local = self._local
+
+        def guarded(*args, **kwargs):
+            local.depth += 1
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                local.depth -= 1
+
+        return guarded
+
+    def guard_async(self, fun):
+        awaiting = self._awaiting
+        self._async = True
+
+        async def guarded(*args, **kwargs):
+            token = awaiting.set(awaiting.get() + 1)
+            try:
+                return await fun(*args, **kwargs)
+            finally:
+                awaiting.reset(token)
+
+        return guarded
+
+    def is_internal(self, extra=0):
+        return self._local.depth > 0 or (self._async and self._awaiting.get() > 0)
+
+
+class FrameCallDetector(CallDetector):
+    """Compare the code object of the calling frame against the methods of the class."""
+
+    def __init__(self, klass=None):
+        self._codes = set()
+        if klass is not None:
+            self.join(klass)
+
+    def bind(self, klass):
+        return FrameCallDetector(klass)
+
+    def join(self, klass):
+        codes = self._codes
+        for item in klass.__dict__.values():
+            if isinstance(item, (classmethod, staticmethod)):
+                item = item.__func__
+            if isinstance(item, property):
+                codes.update(f.__code__ for f in (item.fget, item.fset, item.fdel) if hasattr(f, '__code__'))
+            elif hasattr(item, '__code__'):
+                codes.add(item.__code__)
+        return self
+
+    def is_internal(self, extra=0):
+        # 0: is_internal, 1: the wrapper, 2: whoever called the wrapper
+        return sys._getframe(2 + extra).f_code in self._codes
+
+
+class StackCallDetector(CallDetector):
+    """The original behaviour: walk the whole stack and look for the class name."""
+
+    def __init__(self, name=None):
+        self._name = name
+
+    def bind(self, klass):
+        return StackCallDetector(klass.__name__)
+
+    def is_internal(self, extra=0):
+        return self._name in BaseHugger._caller_name(skip=2 + extra)
+
+
+class RecordingPolicy:
+    """Declarative description of which intercepted calls are recorded.
+
+    `include` and `exclude` are fnmatch patterns matched against both `member` and
+    `Class.member` (or `module.function`). `property_gets=False` skips reads of
+    properties and instance attributes. `sample_rate` records that fraction of the calls
+    and `budgets` maps patterns to the maximum number of calls recorded per member.
+
+    The policy is compiled once per member when it is hugged: members which can never be
+    recorded are left unwrapped and members recorded unconditionally get no check at all.
+    Object creation is always recorded, it defines the names later entries refer to, but
+    sampled events are dropped as a whole, so later entries may refer to objects returned
+    by a call which was not recorded.
+    """
+
+    def __init__(self, include=None, exclude=(), property_gets=True, sample_rate=1.0, budgets=None, seed=None):
+        self.include = None if include is None else self._compile(include)
+        self.exclude = self._compile(exclude) if exclude else None
+        self.property_gets = property_gets
+        self.sample_rate = sample_rate
+        self.budgets = [(self._compile([pattern]), budget) for pattern, budget in (budgets or {}).items()]
+        self._random = random.Random(seed)
+
+    @staticmethod
+    def _compile(patterns):
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})' for pattern in patterns))
+
+    @staticmethod
+    def _matches(regex, owner, member):
+        return regex.match(member) is not None or regex.match(f'{owner}.{member}') is not None
+
+    def wants(self, owner, member, get=False):
+        """Whether calls to `owner.member` can be recorded at all."""
+        if get and not self.property_gets:
+            return False
+        if self.include is not None and not self._matches(self.include, owner, member):
+            return False
+        if self.exclude is not None and self._matches(self.exclude, owner, member):
+            return False
+        return True
+
+    def gate(self, owner, member, get=False):
+        """Compile the policy for one member.
+
+        Returns False if the member is never recorded, None if every call is recorded
+        and otherwise a callable returning whether the current call should be recorded.
+        """
+        if not self.wants(owner, member, get):
+            return False
+        budget = next((budget for regex, budget in self.budgets if self._matches(regex, owner, member)), None)
+        rate = self.sample_rate
+        if budget is None and rate >= 1:
+            return None
+        if budget is not None and budget <= 0:
+            return False
+        draw = self._random.random
+        remaining = [budget]
+
+        def gate():
+            if rate < 1 and draw() >= rate:
+                return False
+            if budget is not None:
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+            return True
+
+        return gate
+
+
+class AttributeDescriptor:
+    """Data descriptor standing in for one tracked public instance attribute.
+
+    The value is kept where it would be without hugging, in the instance `__dict__` or,
+    for classes using `__slots__`, in the original slot. `on_get`/`on_set` are called to
+    record the access; every other attribute lookup stays on the native fast path.
+    """
+
+    __slots__ = ('name', 'slot', 'on_get', 'on_set')
+
+    def __init__(self, name, on_get, on_set, slot=None):
+        self.name = name
+        self.slot = slot
+        self.on_get = on_get
+        self.on_set = on_set
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if self.slot is not None:
+            value = self.slot.__get__(obj, objtype)
+        else:
+            try:
+                value = obj.__dict__[self.name]
+            except KeyError:
+                raise AttributeError(f"'{type(obj).__name__}' object has no attribute '{self.name}'") from None
+        self.on_get(obj, value)
+        return value
+
+    def __set__(self, obj, value):
+        self.on_set(obj, value)
+        if self.slot is not None:
+            self.slot.__set__(obj, value)
+        else:
+            obj.__dict__[self.name] = value
+
+    def __delete__(self, obj):
+        if self.slot is not None:
+            self.slot.__delete__(obj)
+        else:
+            try:
+                del obj.__dict__[self.name]
+            except KeyError:
+                raise AttributeError(self.name) from None
 
 
 class BaseHugger:
-    def __init__(self, debug=False):
-        self._count = 0
-        self._history = []
-        self._create_list = []
-        self._unique_vars = []
-        self._unique_rets = []
+    """Records intercepted calls and turns them into a python script.
+
+    If `live` is a writable text stream, every entry is written (and flushed) to it as
+    it is recorded, so an interrupted session still leaves a usable partial script.
+    Awaited calls are written to it as top level `await`s, as `python -m asyncio` runs them.
+    `history` replaces the default unbounded list used to store the entries, e.g. with a
+    `hugger.RingHistory` or `hugger.SegmentedHistory` to bound memory. `detector` is the
+    `CallDetector` deciding which calls are internal, `DepthCallDetector` by default.
+    `policy` is a `RecordingPolicy` restricting what is recorded, everything by default.
+    `metrics=True` (or a `hugger.Metrics` to share) counts and times every call of the
+    hugged members, recorded or not, see `self.metrics`.
+    `values` is a `hugger.ValueStore` (or a directory for one) which large literals and
+    mutable arguments are written to, the script then loads them from there.
+    `background=True` (or a `hugger.RecordingPipeline`) moves the recording work off the
+    calling thread: wrappers only queue the arguments and result of each call, a worker
+    thread builds the entries. Reading `history` or making a script waits for it to catch
+    up, see `flush`. Stored values are then saved as they are when the worker gets to them.
+
+    Tracked objects are watched with `weakref.finalize`: once one is collected its symbol
+    is retired, so an object which later gets the same id gets a fresh name. Objects which
+    cannot be weakly referenced (lists, dicts, ...) are kept alive instead, so their id
+    cannot be reused, at most `max_pinned` of them: the least recently seen is released
+    and its symbol retired beyond that, a later sighting names it afresh.
+    """
+
+    _script_header = '# Auto generated script\n\n'
+    max_pinned = 4096
+
+    def __init__(self, debug=False, live=None, history=None, detector=None, policy=None, metrics=False,
+                 values=None, background=None):
+        self._history = [] if history is None else history
+        self._symbols = {}
+        # id -> (object, registry, symbol) of tracked objects which cannot be weakly referenced
+        self._pinned = OrderedDict()
+        self._create_list = IdentityRegistry()
+        self._unique_vars = IdentityRegistry()
+        self._unique_rets = IdentityRegistry()
         self.debug = debug
-        self._old_set_attr = None
-        self._old_get_attr = None
         self.__var_ident = 'var_'
         self.__ret_ident = 'obj_'
+        self.detector = DepthCallDetector() if detector is None else detector
+        self.policy = policy
+        self.metrics = (Metrics() if metrics is True else metrics) or None
+        self.values = ValueStore(values) if isinstance(values, str) else values
+        self.pipeline = (RecordingPipeline() if background is True else background) or None
+        if self.pipeline is not None:
+            self._emit = self.pipeline.push
+        self.enabled = True
+        # Open `recording` windows, and whether the hugger was enabled before the first
+        self._windows = 0
+        self._enabled_outside = True
+        self._window_lock = threading.Lock()
+        self.live = live
+        if live is not None:
+            live.write(self._header())
+            live.flush()
+
+    @property
+    def history(self):
+        """The recorded entries."""
+        self.flush()
+        return self._history
+
+    def flush(self):
+        """Wait until the calls made so far are in the history, with a background pipeline."""
+        if self.pipeline is not None:
+            self.pipeline.flush()
+
+    @staticmethod
+    def _emit(record, args, kwargs, result, required=False):
+        # Replaced by the pipeline's `push` in background mode
+        record(args, kwargs, result)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    @contextmanager
+    def recording(self):
+        """Intercept calls only inside a window, as a `with` block or a decorator.
+
+            hugger.hug(Foo)
+            hugger.disable()
+            with hugger.recording():
+                ...
+
+        Outside the window the original members are in place, so code runs at native
+        speed. The window is process wide, it is not limited to the current thread.
+        Windows may overlap, e.g. one per request in a server: the first to open enables
+        the hugger, the last to close disables it again unless it was enabled before.
+        """
+        with self._window_lock:
+            if not self._windows:
+                self._enabled_outside = self.enabled
+                self.enable()
+            self._windows += 1
+        try:
+            yield self
+        finally:
+            with self._window_lock:
+                self._windows -= 1
+                if not self._windows and not self._enabled_outside:
+                    self.disable()
+
+    def _gate(self, owner, member, get=False):
+        return None if self.policy is None else self.policy.gate(owner, member, get)
+
+    def _instrument(self, fun, owner, member):
+        return fun if self.metrics is None else self.metrics.instrument(fun, owner, member)
+
+    def _counter(self, owner, member):
+        return None if self.metrics is None else self.metrics.slot(owner, member)
+
+    def _is_tracked(self, obj):
+        return self._symbol_of(obj) is not None
+
+    def _symbol_of(self, obj):
+        """The symbol of `obj`, None if it is not tracked."""
+        obj_id = id(obj)
+        symbol = self._symbols.get(obj_id)
+        if symbol is not None and obj_id in self._pinned:
+            try:
+                self._pinned.move_to_end(obj_id)
+            except KeyError:
+                # Released by another thread meanwhile
+                pass
+        return symbol
+
+    def _track(self, registry, obj, prefix, replace=False):
+        """Register `obj` in `registry` and name it `{prefix}{index}` in the script.
+
+        Takes no lock: the slot is reserved first, then `setdefault` on the symbol table
+        decides which of several threads meeting the same object names it, the others
+        leave their slot unused. Unless `replace` is set an object which is already
+        tracked keeps its symbol.
+        """
+        obj_id = id(obj)
+        if not replace:
+            symbol = self._symbol_of(obj)
+            if symbol is not None:
+                return symbol
+        index = registry.reserve()
+        symbol = Symbol(f'{prefix}{index}')
+        if replace:
+            registry.discard(obj_id)
+            self._symbols[obj_id] = symbol
+        else:
+            claimed = self._symbols.setdefault(obj_id, symbol)
+            if claimed is not symbol:
+                return claimed
+        registry.bind(obj_id, index)
+        self._watch(registry, obj, symbol)
+        return symbol
+
+    def _watch(self, registry, obj, symbol):
+        obj_id = id(obj)
+        try:
+            weakref.finalize(obj, self._retire, registry, obj_id, symbol).atexit = False
+        except TypeError:
+            pinned = self._pinned
+            pinned[obj_id] = (obj, registry, symbol)
+            while len(pinned) > self.max_pinned:
+                try:
+                    old_id, (_, old_registry, old_symbol) = pinned.popitem(last=False)
+                except KeyError:
+                    # Emptied by another thread meanwhile
+                    break
+                self._retire(old_registry, old_id, old_symbol)
+
+    def _retire(self, registry, obj_id, symbol):
+        """Forget the object named `symbol`, unless its id has been taken over already.
+
+        Takes no lock either: finalizers run before the memory of the object is freed, so
+        no other object can claim its id in the meantime.
+        """
+        if self._symbols.get(obj_id) is symbol:
+            self._symbols.pop(obj_id, None)
+            registry.discard(obj_id)
+
+    def _track_var(self, value):
+        symbol = self._track(self._unique_vars, value, self.__var_ident)
+        if self.values is not None:
+            key = self.values.put(value)
+            if key is not None:
+                # Defines `var_N` in the script, ahead of the entry using it
+                self._record(HistoryEntry(None, CallType.LOAD_VALUE, None, self.values.reference(key),
+                                          returns=(symbol,)))
+        return symbol
+
+    def _resolve(self, value):
+        """Replace a mutable value by its symbol, registering it as a variable if needed.
+
+        Large literals are replaced by a reference into the value store, if there is one.
+        """
+        if not self.__is_mutable(value):
+            if self.values is not None and self.values.wants(value):
+                key = self.values.put(value)
+                if key is not None:
+                    return Symbol(self.values.reference(key))
+            return value
+        symbol = self._symbol_of(value)
+        if symbol is None:
+            symbol = self._track_var(value)
+        return symbol
+
+    def _record(self, entry):
+        self._history.append(entry)
+        if self.live is not None:
+            self.live.write(self._format_entry(entry))
+            self.live.flush()
 
     def _argument_checker(self, *args, **kwargs):
         for arg in args:
-            if self.__is_mutable(arg):
-                if id(arg) not in self._unique_rets and \
-                        id(arg) not in self._create_list and \
-                        id(arg) not in self._unique_vars:
-                    self._unique_vars.append(id(arg))
+            if self.__is_mutable(arg) and not self._is_tracked(arg):
+                self._track_var(arg)
         for item in kwargs.values():
-            if self.__is_mutable(item):
-                if id(item) not in self._unique_rets and \
-                        id(item) not in self._create_list and \
-                        id(item) not in self._unique_vars:
-                    self._unique_vars.append(id(item))
+            if self.__is_mutable(item) and not self._is_tracked(item):
+                self._track_var(item)
 
     @staticmethod
     def __is_mutable(arg):
-        ret = True
-        if isinstance(arg, (int, float, complex, str, tuple, frozenset, bytes)):
-            ret = False
-        return ret
+        return not _is_literal(arg)
 
     def _argout(self, result):
+        """Give every returned value an `obj_N` slot and return their symbols.
+
+        An instance of a hugged class keeps its own name: made inside the call, its
+        creation was not recorded, so the call is what defines it in the script.
+        """
         if result is None:
-            ret = 0
-        else:
-            if isinstance(result, tuple):
-                for res in result:
-                    if self.__is_mutable(res):
-                        if id(res) not in self._unique_rets and \
-                                id(res) not in self._create_list and \
-                                id(res) not in self._unique_vars:
-                            self._unique_rets.append(id(res))
-                ret = len(result)
+            return ()
+        if not isinstance(result, tuple):
+            result = (result,)
+        ret = []
+        for res in result:
+            symbol = self._symbol_of(res) if self.__is_mutable(res) else None
+            if symbol is None and self.__is_mutable(res):
+                ret.append(self._track(self._unique_rets, res, self.__ret_ident))
+            elif symbol is not None and id(res) in self._create_list:
+                ret.append(symbol)
             else:
-                if self.__is_mutable(result):
-                    if id(result) not in self._unique_rets and \
-                            id(result) not in self._create_list and \
-                            id(result) not in self._unique_vars:
-                        self._unique_rets.append(id(result))
-                ret = 1
-        return ret
+                ret.append(Symbol(f'{self.__ret_ident}{self._unique_rets.reserve()}'))
+        return tuple(ret)
 
     @staticmethod
     def _caller_name(skip=2):
@@ -110,378 +710,949 @@ class BaseHugger:
         del parentframe
         return ".".join(name)
 
-    @staticmethod
-    def _makeScriptEntry(class_in, call_type, *args, index=None, returns=None, **kwargs):
-        call_function = None
+    def _makeScriptEntry(self, class_in, call_type, *args, returns=(), **kwargs):
+        resolve = self._resolve
         call_obj = None
-        create_index = index
-        call_variables = None
-        call_prop = None
-        returns = returns
-        if call_type == 'create_obj':
-            call_variables = [args, kwargs]
-            create_index = create_index
-        elif call_type == 'fn_call':
-            call_obj = args[0]
-            call_function = args[1]
-            call_variables = [args[2:], kwargs]
-        elif call_type == 'prop_set':
-            call_obj = args[0]
-            call_prop = args[1]
-            if BaseHugger.__is_mutable(args[2]):
-                call_variables = id(args[2])
-            else:
-                call_variables = args[2]
-        elif call_type == 'prop_get':
-            call_obj = args[0]
-            call_prop = args[1]
-        elif call_type == 'magic_method':
-            call_function = args[0]
-            call_variables = [args[1:], kwargs]
-            create_index = create_index
-
-        caller = dict(class_obj=class_in.__name__,
-                      call_type=call_type,
-                      call_obj=call_obj,
-                      call_prop=call_prop,
-                      create_index=create_index,
-                      call_function=call_function,
-                      call_variables=call_variables,
-                      returns=returns)
-        return caller
-
-    def makeScript(self):
-        def parseScriptEntry(entry):
-            class_obj = entry['class_obj']
-            call_type = entry['call_type']
-            call_obj = entry['call_obj']
-            call_prop = entry['call_prop']
-            call_function = entry['call_function']
-            call_variables = entry['call_variables']
-            create_index = entry['create_index']
-            returns = entry['returns']
-
-            class_obj_name = class_obj.lower()
-
-            if call_type == 'create_obj':
-                # No need for name checking on creator.
-                temp = f'{class_obj_name}_{create_index} = {class_obj}('
-                for var in call_variables[0]:
-                    if var in self._unique_vars:
-                        index = self._unique_vars.index(var)
-                        temp += f'{self.__var_ident}{index}, '
-                    elif var in self._unique_rets:
-                        index = self._unique_rets.index(var)
-                        temp += f'{self.__ret_ident}{index}, '
-                    else:
-                        if isinstance(var, str):
-                            var = '"' + var + '"'
-                        temp += f'{var}, '
-                if call_variables[0]:
-                    temp = temp[:-2]
-                temp_i = 0
-                for key, item in call_variables[1].items():
-                    if temp_i == 0 & len(call_variables[0]) > 0:
-                        temp += ', '
-                    if item in self._unique_vars:
-                        index = self._unique_vars.index(item)
-                        temp += f'{key}={self.__var_ident}{index}, '
-                    elif item in self._unique_rets:
-                        index = self._unique_rets.index(item)
-                        temp += f'{key}={self.__ret_ident}{index}, '
-                    else:
-                        if isinstance(item, str):
-                            item = '"' + item + '"'
-                        temp += f'{key}={item}, '
-                    temp_i += 1
-                if call_variables[1]:
-                    temp = temp[:-2]
-                temp += ')\n'
-                return temp
-
-            if call_type == 'magic_method':
-                temp = f'{class_obj_name}_{create_index} = {class_obj}.{call_function}('
-                for var in call_variables[0]:
-                    if var in self._unique_vars:
-                        index = self._unique_vars.index(var)
-                        temp += f'{self.__var_ident}{index}, '
-                    elif var in self._unique_rets:
-                        index = self._unique_rets.index(var)
-                        temp += f'{self.__ret_ident}{index}, '
-                    else:
-                        if isinstance(var, str):
-                            var = '"' + var + '"'
-                        temp += f'{var}, '
-                if call_variables[0]:
-                    temp = temp[:-2]
-                temp_i = 0
-                for key, item in call_variables[1].items():
-                    if temp_i == 0 & len(call_variables[0]) > 0:
-                        temp += ', '
-                    if item in self._unique_vars:
-                        index = self._unique_vars.index(item)
-                        temp += f'{key}={self.__var_ident}{index}, '
-                    elif item in self._unique_rets:
-                        index = self._unique_rets.index(item)
-                        temp += f'{key}={self.__ret_ident}{index}, '
-                    else:
-                        if isinstance(item, str):
-                            item = '"' + item + '"'
-                        temp += f'{key}={item}, '
-                    temp_i += 1
-                if call_variables[1]:
-                    temp = temp[:-2]
-                temp += ')\n'
-                return temp
-
-            idx = self._create_list.index(id(call_obj))
-            if call_type == 'fn_call':
-                temp = ''
-                for i in range(returns):
-                    temp += f'{self.__ret_ident}{i}, '
-                if returns > 0:
-                    temp = temp[:-2]
-                    temp += ' = '
-                temp += f'{class_obj_name}_{idx}.{call_function}('
-                for var in call_variables[0]:
-                    if var in self._unique_vars:
-                        index = self._unique_vars.index(var)
-                        temp += f'{self.__var_ident}{index}, '
-                    elif var in self._unique_rets:
-                        index = self._unique_rets.index(var)
-                        temp += f'{self.__ret_ident}{index}, '
-                    else:
-                        if isinstance(var, str):
-                            var = '"' + var + '"'
-                        temp += f'{var}, '
-                if call_variables[0]:
-                    temp = temp[:-2]
-                temp_i = 0
-                for key, item in call_variables[1].items():
-                    if temp_i == 0 & len(call_variables[0]) > 0:
-                        temp += ', '
-                    if item in self._unique_vars:
-                        index = self._unique_vars.index(item)
-                        temp += f'{key}={self.__var_ident}{index}, '
-                    elif item in self._unique_rets:
-                        index = self._unique_rets.index(item)
-                        temp += f'{key}={self.__ret_ident}{index}, '
-                    else:
-                        if isinstance(item, str):
-                            item = '"' + item + '"'
-                        temp += f'{key}={item}, '
-                    temp_i += 1
-                if call_variables[1]:
-                    temp = temp[:-2]
-                temp += ')\n'
-                return temp
-            elif call_type == 'prop_set':
-                temp = f'{class_obj_name}_{idx}.{call_prop} = '
-                if call_variables in self._create_list:
-                    index = self._create_list.index(call_variables)
-                    temp += f'{class_obj_name}_{index}'
+        member = None
+        if call_type is CallType.CREATE_OBJ:
+            pass
+        elif call_type is CallType.MAGIC_METHOD or call_type is CallType.FUNCTION:
+            member = args[0]
+            args = args[1:]
+        elif call_type is CallType.AWAIT and args[0] is None:
+            # Awaiting a classmethod, staticmethod or function
+            member = args[1]
+            args = args[2:]
+        else:
+            call_obj = resolve(args[0])
+            member = args[1]
+            args = args[2:]
+        if args:
+            args = tuple([resolve(arg) for arg in args])
+        kwargs = {key: resolve(item) for key, item in kwargs.items()} if kwargs else None
+        return HistoryEntry(None if class_in is None else class_in.__name__, call_type, call_obj, member,
+                            args, kwargs, returns)
+
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, Symbol):
+            return value
+        if isinstance(value, str):
+            return '"' + value + '"'
+        return f'{value}'
+
+    @classmethod
+    def _format_arguments(cls, args, kwargs):
+        parts = [cls._format_value(arg) for arg in args]
+        if kwargs:
+            parts.extend(f'{key}={cls._format_value(item)}' for key, item in kwargs.items())
+        return ', '.join(parts)
+
+    @staticmethod
+    def _format_returns(returns):
+        if not returns:
+            return ''
+        return ', '.join(returns) + ' = '
+
+    def _format_entry(self, entry):
+        call_type = entry.call_type
+        target = self._format_returns(entry.returns)
+        if call_type is CallType.CREATE_OBJ:
+            return f'{target}{entry.class_obj}({self._format_arguments(entry.args, entry.kwargs)})\n'
+        if call_type is CallType.MAGIC_METHOD:
+            return f'{target}{entry.class_obj}.{entry.member}({self._format_arguments(entry.args, entry.kwargs)})\n'
+        if call_type is CallType.FN_CALL:
+            return f'{target}{entry.call_obj}.{entry.member}({self._format_arguments(entry.args, entry.kwargs)})\n'
+        if call_type is CallType.PROP_SET:
+            return f'{entry.call_obj}.{entry.member} = {self._format_value(entry.args[0])}\n'
+        if call_type is CallType.PROP_GET:
+            return f'{target}{entry.call_obj}.{entry.member}\n'
+        if call_type is CallType.FUNCTION:
+            owner = '' if entry.class_obj is None else f'{entry.class_obj}.'
+            return f'{target}{owner}{entry.member}({self._format_arguments(entry.args, entry.kwargs)})\n'
+        if call_type is CallType.LOAD_VALUE:
+            return f'{target}{entry.member}\n'
+        if call_type is CallType.AWAIT:
+            owner = entry.class_obj if entry.call_obj is None else entry.call_obj
+            owner = '' if owner is None else f'{owner}.'
+            return f'{target}await {owner}{entry.member}({self._format_arguments(entry.args, entry.kwargs)})\n'
+        if call_type is None:
+            return self._format_loop(entry)
+        raise ValueError(f'Unknown call type {call_type}')
+
+    @staticmethod
+    def _format_range(column):
+        """`range(...)` producing the ints of `column`, None if they are not evenly spaced."""
+        if len(column) < 2 or any(type(value) is not int for value in column):
+            return None
+        start = column[0]
+        step = column[1] - start
+        if step == 0 or any(b - a != step for a, b in zip(column, column[1:])):
+            return None
+        return f'range({start}, {column[-1] + step}, {step})' if step != 1 else f'range({start}, {column[-1] + 1})'
+
+    def _format_loop(self, loop):
+        body = ''.join(f'    {self._format_entry(entry)}' for entry in loop.body)
+        if not loop.names:
+            return f'for _ in range({loop.count}):\n{body}'
+        ranges = [self._format_range(column) for column in loop.columns]
+        if None not in ranges:
+            iterable = ranges[0] if len(ranges) == 1 else f'zip({", ".join(ranges)})'
+            return f'for {", ".join(loop.names)} in {iterable}:\n{body}'
+        if len(loop.names) == 1:
+            rows = ''.join(f'    {self._format_value(value)},\n' for value in loop.columns[0])
+        else:
+            rows = ''.join(f'    ({", ".join(self._format_value(value) for value in row)}),\n'
+                           for row in zip(*loop.columns))
+        return f'for {", ".join(loop.names)} in (\n{rows}):\n{body}'
+
+    def _header(self):
+        if self.values is None:
+            return self._script_header
+        return self._script_header + self.values.preamble()
+
+    def iter_script(self, history=None, asynchronous=None):
+        """Yield the generated script line by line, one line per history entry.
+
+        `history` defaults to the recorded history, but any iterable of entries can be
+        given, e.g. `hugger.read_segments(directory)` to regenerate a spilled session.
+        A history with awaited calls becomes the body of an `async def main()` run by
+        `asyncio.run`. `asynchronous` forces this either way; by default histories which
+        can be iterated twice are scanned for awaits first, others (generators) are not.
+        """
+        if history is None:
+            self.flush()
+            history = self._history
+        if asynchronous is None:
+            asynchronous = iter(history) is not history and any(_awaits(entry) for entry in history)
+        yield self._header()
+        if not asynchronous:
+            for entry in history:
+                yield self._format_entry(entry)
+            return
+        yield 'import asyncio\n\n\nasync def main():\n'
+        empty = True
+        for entry in history:
+            yield ''.join(f'    {line}' for line in self._format_entry(entry).splitlines(True))
+            empty = False
+        if empty:
+            yield '    pass\n'
+        yield '\n\nasyncio.run(main())\n'
+
+    def write_script(self, fp, history=None, asynchronous=None):
+        """Stream the generated script into the writable text stream `fp`."""
+        fp.writelines(self.iter_script(history, asynchronous))
+
+    def makeScript(self, history=None, asynchronous=None):
+        return ''.join(self.iter_script(history, asynchronous))
+
+
+def _wrap_like(wrapper, fun):
+    """`functools.update_wrapper` for the attributes that matter, at a fraction of the cost.
+
+    Hugging a package wraps thousands of members, where `update_wrapper` dominates.
+    """
+    wrapper.__name__ = getattr(fun, '__name__', wrapper.__name__)
+    wrapper.__qualname__ = getattr(fun, '__qualname__', wrapper.__qualname__)
+    wrapper.__doc__ = getattr(fun, '__doc__', None)
+    wrapper.__module__ = getattr(fun, '__module__', None)
+    wrapper.__wrapped__ = fun
+    return wrapper
+
+
+class _AsyncIterator:
+    """Stands in for the async generator returned by a hugged member.
+
+    Every item is recorded as `obj_M = await obj_N.__anext__()`, so a script stops
+    consuming the generator exactly where the recorded session did. The end of the
+    iteration is not recorded, in the script it would raise `StopAsyncIteration`.
+    """
+
+    __slots__ = ('_hugger', '_class_in', '_agen', '_next', '_detector', '__weakref__')
+
+    def __init__(self, hugger, class_in, agen, detector):
+        self._hugger = hugger
+        self._class_in = class_in
+        self._agen = agen
+        self._next = detector.guard_async(agen.__anext__)
+        self._detector = detector
+
+    def __aiter__(self):
+        return self
+
+    def _record(self, member, _, res):
+        hugger = self._hugger
+        hugger._record(hugger._makeScriptEntry(self._class_in, CallType.AWAIT, self, member,
+                                               returns=hugger._argout(res)))
+
+    async def __anext__(self):
+        if self._detector.is_internal():
+            return await self._next()
+        res = await self._next()
+        self._hugger._emit(self._record, '__anext__', None, res)
+        return res
+
+    async def aclose(self):
+        await self._agen.aclose()
+        if not self._detector.is_internal():
+            self._hugger._emit(self._record, 'aclose', None, None)
+
+    def asend(self, value):
+        return self._agen.asend(value)
+
+    def athrow(self, *args):
+        return self._agen.athrow(*args)
+
+
+class _HuggedClass:
+    """What hugging did to one class: its detector and the members it replaced.
+
+    `originals` maps every name set on the class to what the class dict held before,
+    `_ABSENT` if nothing. `members` are the names seen at the last construction and
+    `added` the members added after hugging, as they were left after wrapping.
+    """
+
+    __slots__ = ('klass', 'name', 'detector', 'originals', 'installed', 'members', 'added', 'tracked')
+
+    def __init__(self, klass, detector):
+        self.klass = klass
+        self.name = klass.__name__
+        self.detector = detector
+        self.originals = {}
+        self.installed = {}
+        self.members = set()
+        self.added = {}
+        self.tracked = set()
+
+    def install(self, name, value):
+        current = self.klass.__dict__.get(name, _ABSENT)
+        if name not in self.originals or current is not self.installed.get(name):
+            # Anything but our own wrapper is what the class would have without us
+            self.originals[name] = current
+        self.installed[name] = value
+        setattr(self.klass, name, value)
+
+    def disable(self):
+        """Put the originals back, except where something replaced our wrapper since."""
+        klass = self.klass
+        class_dict = klass.__dict__
+        for name, wrapper in self.installed.items():
+            if class_dict.get(name, _ABSENT) is wrapper:
+                original = self.originals[name]
+                if original is _ABSENT:
+                    delattr(klass, name)
                 else:
-                    if call_variables in self._unique_vars:
-                        index = self._unique_vars.index(call_variables)
-                        temp += f'{self.__var_ident}{index}'
-                    elif call_variables in self._unique_rets:
-                        index = self._unique_rets.index(call_variables)
-                        temp += f'{self.__ret_ident}{index}'
-                    else:
-                        if isinstance(call_variables, str):
-                            call_variables = '"' + call_variables + '"'
-                        temp += f'{call_variables}'
-                temp += '\n'
-                return temp
-            elif call_type == 'prop_get':
-                temp = ''
-                for i in range(returns):
-                    temp += f'{self.__ret_ident}{i}, '
-                if returns > 0:
-                    temp = temp[:-2]
-                    temp += ' = '
-                temp += f'{class_obj_name}_{idx}.{call_prop}\n'
-                return temp
-
-        text = '# Auto generated script\n\n'
-        for call in self._history:
-            text += parseScriptEntry(call)
-        return text
+                    setattr(klass, name, original)
+
+    def enable(self):
+        """Put the wrappers back and return the members which changed while disabled."""
+        klass = self.klass
+        class_dict = klass.__dict__
+        changed = {}
+        for name, wrapper in self.installed.items():
+            current = class_dict.get(name, _ABSENT)
+            if current is self.originals[name]:
+                setattr(klass, name, wrapper)
+            elif current is not _ABSENT and current is not wrapper:
+                changed[name] = current
+        return changed
+
 
+_ABSENT = object()
 
 
 class ClassHugger(BaseHugger):
+    """Hug classes: construction, methods, properties and public instance attributes.
+
+    `attributes` selects how instance attributes are intercepted. 'getattribute' wraps the
+    class `__getattribute__`/`__setattr__`, which sees every attribute but slows down all
+    lookups. 'descriptor' installs an `AttributeDescriptor` for the public attributes
+    found on constructed instances (and public `__slots__`), leaving every other lookup
+    untouched.
+
+    Wrappers are made by one factory per kind of member (method, classmethod/staticmethod,
+    property getter and setter, attribute, constructor), so hugging a class only creates a
+    closure per member. Classes of one hierarchy share their call detector, calls between
+    them are internal.
+    """
 
-    def __init__(self, debug=False):
-        super().__init__(debug=debug)
-        self._auto_props = None
+    def __init__(self, debug=False, live=None, detector=None, history=None, policy=None, attributes='getattribute',
+                 metrics=False, values=None, background=None):
+        super().__init__(debug=debug, live=live, history=history, detector=detector, policy=policy, metrics=metrics,
+                         values=values, background=background)
+        if attributes not in ('getattribute', 'descriptor'):
+            raise ValueError(f'Unknown attribute interception mode {attributes}')
+        self.attributes = attributes
+        self._classes = {}
 
     def hug(self, klass):
-        old_init = klass.__init__
-        self._old_set_attr = klass.__setattr__
-        self._old_get_attr = klass.__getattribute__
+        if klass in self._classes:
+            return klass
+        state = self._classes[klass] = _HuggedClass(klass, self._detector_for(klass))
+        patch_init = self._wrap_init(state)
+        self._patch_members(state, klass.__dict__)
+        state.install('__init__', patch_init)
+        self._patch_attributes(state)
+        state.members.update(klass.__dict__)
+        if not self.enabled:
+            state.disable()
+        return klass
+
+    def enable(self):
+        """Put the wrappers of every hugged class back in place."""
+        for state in self._classes.values():
+            changed = state.enable()
+            if changed:
+                # Replaced while disabled: wrap the new members and watch them like added ones
+                self._patch_members(state, changed)
+                class_dict = state.klass.__dict__
+                for key in changed:
+                    state.added[key] = class_dict[key]
+            # Members added while disabled are wrapped as if added while enabled
+            self._refresh_members(state)
+        self.enabled = True
+
+    def disable(self):
+        """Put the original members of every hugged class back, wrappers are kept for `enable`."""
+        for state in self._classes.values():
+            state.disable()
+        self.enabled = False
+
+    def unhug(self, klass=None):
+        """Restore the original members of `klass`, or of every hugged class, and forget them."""
+        if klass is None:
+            states = list(self._classes.values())
+            self._classes.clear()
+        else:
+            states = [self._classes.pop(klass)]
+        for state in reversed(states):
+            state.disable()
+
+    def hug_many(self, classes, subclasses=False):
+        """Hug `classes`, and with `subclasses` everything derived from them, bases first."""
+        classes = list(classes)
+        if subclasses:
+            seen = set(classes)
+            stack = list(classes)
+            while stack:
+                for sub in stack.pop().__subclasses__():
+                    if sub not in seen:
+                        seen.add(sub)
+                        classes.append(sub)
+                        stack.append(sub)
+        # Wrapping allocates many small objects, which would trigger full collections
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for klass in sorted(classes, key=lambda cls: len(cls.__mro__)):
+                self.hug(klass)
+        finally:
+            if enabled:
+                gc.enable()
+        return classes
+
+    def hug_module(self, module, names=None, subclasses=False):
+        """Hug the public classes defined in `module`, or only `names`."""
+        if names is None:
+            names = [key for key, value in vars(module).items()
+                     if not key.startswith('_') and isinstance(value, type) and value.__module__ == module.__name__]
+        return self.hug_many([getattr(module, name) for name in names], subclasses)
+
+    def hug_package(self, package, subclasses=False):
+        """Import every module of `package` and hug the public classes defined in them."""
+        modules = [package]
+        for info in pkgutil.walk_packages(getattr(package, '__path__', []), f'{package.__name__}.'):
+            modules.append(importlib.import_module(info.name))
+        classes = []
+        for module in modules:
+            classes.extend(value for key, value in vars(module).items()
+                           if not key.startswith('_') and isinstance(value, type)
+                           and value.__module__ == module.__name__)
+        return self.hug_many(classes, subclasses)
+
+    def _detector_for(self, klass):
+        for base in klass.__mro__[1:]:
+            state = self._classes.get(base)
+            if state is not None:
+                return state.detector.join(klass)
+        return self.detector.bind(klass)
+
+    def _original(self, klass, name):
+        """`name` as `klass` would resolve it in its class dicts without any hugging."""
+        for base in klass.__mro__:
+            state = self._classes.get(base)
+            if state is not None and name in state.originals:
+                value = state.originals[name]
+            else:
+                value = base.__dict__.get(name, _ABSENT)
+            if value is not _ABSENT:
+                return value
+        raise AttributeError(name)
+
+    def _refresh_members(self, state):
+        # Wrap what was added, or what replaced a member added after hugging
+        class_dict = state.klass.__dict__
+        members = state.members
+        added = state.added
+        changed = {key: value for key, value in class_dict.items()
+                   if key not in members or (key in added and value is not added[key])}
+        self._patch_members(state, changed)
+        for key in changed:
+            added[key] = class_dict[key]
+        for key in list(added):
+            if key not in class_dict:
+                del added[key]
+        members.clear()
+        members.update(class_dict)
+
+    def _patch_members(self, state, members):
+        for key, value in list(members.items()):
+            if key == '__init__':
+                # patch_init
+                continue
+            if isinstance(value, property):
+                wrapper = self._wrap_property(state, key, value)
+            elif isinstance(value, (classmethod, staticmethod)) or callable(value):
+                gate = self._gate(state.name, key)
+                if gate is False:
+                    continue
+                if isinstance(value, (classmethod, staticmethod)):
+                    wrapper = type(value)(self._wrap_magic(state, key, value, gate))
+                else:
+                    wrapper = self._wrap_method(state, key, value, gate)
+            else:
+                continue
+            if wrapper is not None:
+                state.install(key, wrapper)
+
+    def _patch_attributes(self, state):
+        klass = state.klass
+        if self.attributes == 'descriptor':
+            for key, value in list(klass.__dict__.items()):
+                if isinstance(value, types.MemberDescriptorType) and key[0] != '_':
+                    self._track_attribute(state, key, slot=value)
+            return
+        if self.policy is None or self.policy.property_gets:
+            state.install('__getattribute__', self._wrap_getattribute(state, self._original(klass, '__getattribute__')))
+        state.install('__setattr__', self._wrap_setattr(state, self._original(klass, '__setattr__')))
+
+    def _attribute_gate(self, state, gates, name, get=False):
+        # Instance attributes are only known when first used, compile their policy then
+        try:
+            return gates[name]
+        except KeyError:
+            gate = gates[name] = self._gate(state.name, name, get)
+            return gate
+
+    def _attribute_counter(self, state, counters, name, suffix=''):
+        # Cached like the gates, the metrics key is only built on the first access
+        try:
+            return counters[name]
+        except KeyError:
+            counter = counters[name] = self.metrics.slot(state.name, f'{name}{suffix}')
+            return counter
+
+    def _wrap_init(self, state):
+        klass = state.klass
+        detector = state.detector
+        old_init = self._instrument(detector.guard(self._original(klass, '__init__')), state.name, '__init__')
+        prefix = f'{state.name.lower()}_'
+        descriptors = self.attributes == 'descriptor'
+        tracked = state.tracked
+        members = state.members
+        added = state.added
+        deferred = self.pipeline is not None
+
+        def record(args, kwargs, internal):
+            obj = args[0]
+            if internal and id(obj) in self._create_list:
+                # Only when deferred, the wrapper checks this itself otherwise
+                return
+            symbol = self._track(self._create_list, obj, prefix, replace=True)
+            # Objects made inside the class (e.g. by a classmethod) are recorded by that call
+            if not internal:
+                if deferred:
+                    self._argument_checker(*args[1:], **kwargs)
+                self._record(self._makeScriptEntry(klass, CallType.CREATE_OBJ, *args[1:], returns=(symbol,),
+                                                   **kwargs))
 
         def patch_init(obj, *args, **kwargs):
-            if self.debug:
-                print(f"{klass.__name__} is created with {args}, {kwargs}")
-            self._history.append(self._makeScriptEntry(klass, 'create_obj', *args, index=self._count, **kwargs))
-            old_init(obj, *args, **kwargs)
-            self._create_list.append(id(obj))
-            self._count += 1
-            new_props = self._auto_props.symmetric_difference(set(klass.__dict__.keys()))
-            if new_props:
-                prop_dict = {}
-                for prop in list(new_props):
-                    prop_dict[prop] = klass.__dict__[prop]
-                patch_methods_properties(prop_dict)
-
-        def patch_methods_properties(this_dict):
-            for key in this_dict.keys():
-                if isinstance(this_dict[key], Callable):
-                    setattr(klass, key, fun_wrap(this_dict[key]))
-                elif isinstance(this_dict[key], property):
-                    if this_dict[key].fget.__name__ != key:
-                        setattr(klass, key,
-                                property(fun_get_wrap(this_dict[key].fget, name=key),
-                                         fun_set_wrap(this_dict[key].fset, name=key),
-                                         this_dict[key].fdel))
-                    else:
-                        setattr(klass, key,
-                                property(fun_get_wrap(this_dict[key].fget), fun_set_wrap(this_dict[key].fset),
-                                         this_dict[key].fdel))
-                elif isinstance(this_dict[key], (classmethod, staticmethod)):
-                    setattr(klass, key, fun_wrap(this_dict[key], name=key))
-
-        def patch_getter_setter(obj):
-            obj.__getattribute__ = get_wrapper(self._old_get_attr)
-            obj.__setattr__ = set_wrapper(self._old_set_attr)
-
-        def fun_get_wrap(fun, name=None):
-            if name is None:
-                name = fun.__name__
-
-            @wraps(fun)
-            def inner(*args, **kwargs):
-                self._argument_checker(*args, **kwargs)
+            internal = detector.is_internal()
+            if internal and id(obj) in self._create_list:
+                # super().__init__ of a hugged base, the object is already named
+                old_init(obj, *args, **kwargs)
+                return
+            if not internal:
                 if self.debug:
-                    print(f"I''m {args[0]} and getting {name}")
-                res = fun(*args, **kwargs)
-                ret = self._argout(res)
-                self._history.append(self._makeScriptEntry(klass, 'prop_get', *[args[0], name, *args[1:]], returns=ret,
-                                                           **kwargs))
-                return res
+                    print(f"{klass.__name__} is created with {args}, {kwargs}")
+                if not deferred:
+                    self._argument_checker(*args, **kwargs)
+            # Never dropped, it defines the name later entries use
+            self._emit(record, (obj, *args), kwargs, internal, True)
+            old_init(obj, *args, **kwargs)
+            if descriptors:
+                instance_dict = getattr(obj, '__dict__', None)
+                if instance_dict:
+                    for key, value in list(instance_dict.items()):
+                        if key not in tracked and key[0] != '_' and not callable(value):
+                            self._track_attribute(state, key)
+            # O(1) unless the class was changed, by this constructor or since the last one
+            class_dict = klass.__dict__
+            if len(class_dict) != len(members) or \
+                    any(class_dict.get(key) is not value for key, value in added.items()):
+                self._refresh_members(state)
 
-            return inner
+        return patch_init
 
-        def fun_set_wrap(fun, name=None):
-            if name is None:
-                name = fun.__name__
+    def _wrap_method(self, state, name, fun, gate=None):
+        klass = state.klass
+        detector = state.detector
+        name = sys.intern(name)
+        if self.debug:
+            print(f"I''ve wrapped {klass.__name__}.{name}")
+        if inspect.iscoroutinefunction(fun) or inspect.isasyncgenfunction(fun):
+            return self._wrap_async(state, name, fun, gate)
+        call = self._instrument(detector.guard(fun), state.name, name)
+        deferred = self.pipeline is not None
 
-            def inner(*args, **kwargs):
+        def record(args, kwargs, res):
+            if deferred:
                 self._argument_checker(*args, **kwargs)
-                self._history.append(self._makeScriptEntry(klass, 'prop_set', *[args[0], name, *args[1:]], **kwargs))
+            ret = self._argout(res)
+            self._record(self._makeScriptEntry(klass, CallType.FN_CALL, *[args[0], name, *args[1:]],
+                                               returns=ret, **kwargs))
+
+        def inner(*args, **kwargs):
+            if detector.is_internal() or (gate is not None and not gate()):
                 if self.debug:
-                    print(f"I''m {args[0]} and getting {name}")
-                return fun(*args, **kwargs)
+                    print(f"I've been called from inside {klass.__name__}")
+                return call(*args, **kwargs)
+            if not deferred:
+                self._argument_checker(*args, **kwargs)
+            if self.debug:
+                print(f"I''m {args[0]}.{name} and have been called with {args[1:]}, {kwargs}")
+            res = call(*args, **kwargs)
+            self._emit(record, args, kwargs, res)
+            return res
+
+        return _wrap_like(inner, fun)
 
-            return inner
+    def _wrap_magic(self, state, name, descriptor, gate=None):
+        # Installed as the same kind of descriptor, so `args` are already bound
+        klass = state.klass
+        detector = state.detector
+        name = sys.intern(name)
+        if self.debug:
+            print(f"I''ve wrapped {klass.__name__}.{name}")
+        fun = descriptor.__func__
+        bound = 1 if isinstance(descriptor, classmethod) else 0
+        if inspect.iscoroutinefunction(fun) or inspect.isasyncgenfunction(fun):
+            return self._wrap_async(state, name, fun, gate, bound)
+        call = self._instrument(detector.guard(fun), state.name, name)
+        deferred = self.pipeline is not None
 
-        def fun_wrap(fun, name=None):
-            if name is None:
-                name = fun.__name__
+        def record(args, kwargs, res):
+            if deferred:
+                self._argument_checker(*args[bound:], **kwargs)
+            ret = self._argout(res)
+            # A classmethod records the class it was called on, which may be a subclass
+            self._record(self._makeScriptEntry(args[0] if bound else klass, CallType.MAGIC_METHOD, name,
+                                               *args[bound:], returns=ret, **kwargs))
 
+        def inner(*args, **kwargs):
+            if detector.is_internal() or (gate is not None and not gate()):
+                if self.debug:
+                    print(f"I've been called from inside {klass.__name__}")
+                return call(*args, **kwargs)
+            if not deferred:
+                self._argument_checker(*args[bound:], **kwargs)
             if self.debug:
-                print(f"I''ve wrapped {klass.__name__}.{name}")
+                print(f"I''m {klass.__name__}.{name} and have been called with {args[bound:]}, {kwargs}")
+            res = call(*args, **kwargs)
+            self._emit(record, args, kwargs, res)
+            return res
+
+        return _wrap_like(inner, fun)
+
+    def _wrap_async(self, state, name, fun, gate=None, bound=None):
+        """`_wrap_method`, or `_wrap_magic` with `bound` set, for async members.
+
+        A coroutine is recorded once awaited, as `obj_N = await foo_0.member(...)`, inline
+        in the awaiting task: nothing is scheduled on the event loop. Entries are in the
+        order the calls complete. An async generator is recorded when created, items are
+        recorded as they are consumed, see `_AsyncIterator`.
+        """
+        klass = state.klass
+        detector = state.detector
+        deferred = self.pipeline is not None
+        skip = bound or 0
+
+        def record(args, kwargs, res, call_type=CallType.AWAIT):
+            if deferred:
+                self._argument_checker(*args[skip:], **kwargs)
+            ret = self._argout(res)
+            if bound is None:
+                entry = self._makeScriptEntry(klass, call_type, args[0], name, *args[1:], returns=ret, **kwargs)
+            elif call_type is CallType.AWAIT:
+                entry = self._makeScriptEntry(args[0] if bound else klass, call_type, None, name, *args[bound:],
+                                              returns=ret, **kwargs)
+            else:
+                entry = self._makeScriptEntry(args[0] if bound else klass, call_type, name, *args[bound:],
+                                              returns=ret, **kwargs)
+            self._record(entry)
+
+        if inspect.isasyncgenfunction(fun):
+            call = self._instrument(fun, state.name, name)
+            call_type = CallType.FN_CALL if bound is None else CallType.MAGIC_METHOD
+
+            def record_call(args, kwargs, res):
+                record(args, kwargs, res, call_type)
 
-            @wraps(fun)
             def inner(*args, **kwargs):
+                if detector.is_internal() or (gate is not None and not gate()):
+                    return call(*args, **kwargs)
+                if not deferred:
+                    self._argument_checker(*args[skip:], **kwargs)
+                res = _AsyncIterator(self, klass, call(*args, **kwargs), detector)
+                self._emit(record_call, args, kwargs, res)
+                return res
+        else:
+            call = self._instrument(detector.guard_async(fun), state.name, name)
+
+            async def inner(*args, **kwargs):
+                if detector.is_internal() or (gate is not None and not gate()):
+                    return await call(*args, **kwargs)
+                if not deferred:
+                    self._argument_checker(*args[skip:], **kwargs)
+                res = await call(*args, **kwargs)
+                self._emit(record, args, kwargs, res)
+                return res
+
+        return _wrap_like(inner, fun)
+
+    def _wrap_property(self, state, name, prop):
+        gate = self._gate(state.name, name)
+        get_gate = self._gate(state.name, name, get=True)
+        if gate is False and get_gate is False:
+            return None
+        fget = prop.fget
+        fset = prop.fset
+        return property(fget if get_gate is False or fget is None else self._wrap_get(state, name, fget, get_gate),
+                        fset if gate is False or fset is None else self._wrap_set(state, name, fset, gate),
+                        prop.fdel)
+
+    def _wrap_get(self, state, name, fun, gate=None):
+        klass = state.klass
+        detector = state.detector
+        name = sys.intern(name)
+        call = self._instrument(detector.guard(fun), state.name, name)
+        deferred = self.pipeline is not None
+
+        def record(args, kwargs, res):
+            if deferred:
                 self._argument_checker(*args, **kwargs)
-                caller = self._caller_name(skip=1)
-                skip = False
-                if klass.__name__ in caller:
-                    if self.debug:
-                        print(f"I've been called from {caller}")
-                    skip = True
-
-                if name != 'patch_init':
-                    if self.debug:
-                        print(f"I''m {args[0]}.{name} and have been called with {args[1:]}, {kwargs}")
-                    if isinstance(fun, (classmethod, staticmethod)):
-                        if isinstance(fun, classmethod):
-                            res = getattr(fun, '__func__')(klass, *args, **kwargs)
-                            if skip:
-                                return res
-                            self._count -= 1
-                            ret = self._argout(res)
-                            self._history[-1] = self._makeScriptEntry(klass, 'magic_method', *[name, *args[1:]],
-                                                                      returns=ret, index=self._count, **kwargs)
-                        else:
-                            res = getattr(fun, '__func__')(*args[1:], **kwargs)
-                            if skip:
-                                return res
-                            ret = self._argout(res)
-                            self._history.append(self._makeScriptEntry(klass, 'magic_method', *[name, *args[1:]],
-                                                                       returns=ret, index=self._count, **kwargs))
-                    else:
-                        res = fun(*args, **kwargs)
-                        if skip:
-                            return res
-                        ret = self._argout(res)
-                        self._history.append(self._makeScriptEntry(klass, 'fn_call', *[args[0], name, *args[1:]],
-                                                                   returns=ret, **kwargs))
-                    return res
-                return fun(*args, **kwargs)
-            return inner
+            ret = self._argout(res)
+            self._record(self._makeScriptEntry(klass, CallType.PROP_GET, *[args[0], name, *args[1:]], returns=ret,
+                                               **kwargs))
 
-        def get_wrapper(fun):
-            def checker(this_fun, thisitem):
-                return thisitem in this_fun.__dict__.keys()
+        def inner(*args, **kwargs):
+            if detector.is_internal() or (gate is not None and not gate()):
+                return call(*args, **kwargs)
+            if not deferred:
+                self._argument_checker(*args, **kwargs)
+            if self.debug:
+                print(f"I''m {args[0]} and getting {name}")
+            res = call(*args, **kwargs)
+            self._emit(record, args, kwargs, res)
+            return res
 
-            @wraps(fun)
-            def inner(*args, **kwargs):
-                if args[1] == '__dict__':
-                    return fun(*args, **kwargs)
-                if not checker(args[0], args[1]):
-                    return fun(*args, **kwargs)
-                if isinstance(args[0].__dict__[args[1]], Callable):
-                    return fun(*args, **kwargs)
-                if args[1][0] != '_':
-                    if self.debug:
-                        print(f"I''m getting {args[0]}.{args[1]}")
-                    self._history.append(
-                        self._makeScriptEntry(klass, 'prop_get', *[args[0], fun.__name__, *args[1:]], **kwargs))
+        return _wrap_like(inner, fun)
 
-                return fun(*args, **kwargs)
+    def _wrap_set(self, state, name, fun, gate=None):
+        klass = state.klass
+        detector = state.detector
+        name = sys.intern(name)
+        call = self._instrument(detector.guard(fun), state.name, f'{name}=')
 
-            return inner
+        def record(args, kwargs, _):
+            self._argument_checker(*args, **kwargs)
+            self._record(self._makeScriptEntry(klass, CallType.PROP_SET, *[args[0], name, *args[1:]], **kwargs))
 
-        def set_wrapper(fun):
-            def checker(this_fun, thisitem):
-                return thisitem in this_fun.__dict__.keys()
+        def inner(*args, **kwargs):
+            if detector.is_internal() or (gate is not None and not gate()):
+                return call(*args, **kwargs)
+            self._emit(record, args, kwargs, None)
+            if self.debug:
+                print(f"I''m {args[0]} and getting {name}")
+            return call(*args, **kwargs)
 
-            @wraps(fun)
-            def inner(*args, **kwargs):
-                if args[1] == '__dict__':
-                    return fun(*args, **kwargs)
-                if not checker(args[0], args[1]):
-                    return fun(*args, **kwargs)
-                if isinstance(args[0].__dict__[args[1]], Callable):
-                    return fun(*args, **kwargs)
-                if args[1][0] != '_':
-                    if self.debug:
-                        print(f"I''m setting {args[0]}.{args[1]} to {args[2]}")
-                    self._history.append(
-                        self._makeScriptEntry(klass, 'prop_set', *args, **kwargs))
+        return _wrap_like(inner, fun)
+
+    def _track_attribute(self, state, name, slot=None):
+        klass = state.klass
+        state.tracked.add(name)
+        if name in klass.__dict__ and slot is None:
+            # A class attribute, property or method with the same name, not ours to shadow
+            return
+        detector = state.detector
+        gate = self._gate(state.name, name)
+        get_gate = self._gate(state.name, name, get=True)
+        if gate is False and get_gate is False:
+            return
+        name = sys.intern(name)
+        get_count = self._counter(state.name, name)
+        set_count = self._counter(state.name, f'{name}=')
+
+        def record_get(obj, _, value):
+            self._record(self._makeScriptEntry(klass, CallType.PROP_GET, obj, name, returns=self._argout(value)))
+
+        def record_set(obj, _, value):
+            self._argument_checker(value)
+            self._record(self._makeScriptEntry(klass, CallType.PROP_SET, obj, name, value))
+
+        def on_get(obj, value):
+            if get_count is not None:
+                get_count.calls += 1
+            if get_gate is False or detector.is_internal(1) or (get_gate is not None and not get_gate()):
+                return
+            if self.debug:
+                print(f"I''m getting {obj}.{name}")
+            self._emit(record_get, obj, None, value)
+
+        def on_set(obj, value):
+            if set_count is not None:
+                set_count.calls += 1
+            if gate is False or detector.is_internal(1) or (gate is not None and not gate()):
+                return
+            if self.debug:
+                print(f"I''m setting {obj}.{name} to {value}")
+            self._emit(record_set, obj, None, value)
+
+        state.install(name, AttributeDescriptor(name, on_get, on_set, slot))
+        # Not a member to wrap at the next construction
+        state.members.add(name)
+
+    @staticmethod
+    def _checker(obj, name):
+        try:
+            return name in obj.__dict__.keys()
+        except AttributeError:
+            # __slots__ only, use attributes='descriptor' to track those
+            return False
+
+    def _wrap_getattribute(self, state, fun):
+        klass = state.klass
+        detector = state.detector
+        checker = self._checker
+        gates = {}
+        counters = {}
+
+        def record(args, kwargs, res):
+            self._record(self._makeScriptEntry(klass, CallType.PROP_GET, *args, returns=self._argout(res), **kwargs))
+
+        def inner(*args, **kwargs):
+            if args[1] == '__dict__':
+                return fun(*args, **kwargs)
+            if not checker(args[0], args[1]):
+                return fun(*args, **kwargs)
+            if callable(args[0].__dict__[args[1]]):
                 return fun(*args, **kwargs)
+            if args[1][0] != '_' and self.metrics is not None:
+                self._attribute_counter(state, counters, args[1]).calls += 1
+            if args[1][0] != '_' and not detector.is_internal():
+                gate = self._attribute_gate(state, gates, args[1], get=True)
+                if gate is False or (gate is not None and not gate()):
+                    return fun(*args, **kwargs)
+                if self.debug:
+                    print(f"I''m getting {args[0]}.{args[1]}")
+                res = fun(*args, **kwargs)
+                self._emit(record, args, kwargs, res)
+                return res
 
-            return inner
+            return fun(*args, **kwargs)
 
-        klass.__init__ = patch_init
-        patch_methods_properties(klass.__dict__)
-        self._auto_props = {'__getattribute__', '__setattr__', *list(klass.__dict__.keys())}
-        patch_getter_setter(klass)
-        return klass
+        return _wrap_like(inner, fun)
+
+    def _wrap_setattr(self, state, fun):
+        klass = state.klass
+        detector = state.detector
+        checker = self._checker
+        gates = {}
+        counters = {}
+
+        def record(args, kwargs, _):
+            self._record(self._makeScriptEntry(klass, CallType.PROP_SET, *args, **kwargs))
+
+        def inner(*args, **kwargs):
+            if args[1] == '__dict__':
+                return fun(*args, **kwargs)
+            if not checker(args[0], args[1]):
+                return fun(*args, **kwargs)
+            if callable(args[0].__dict__[args[1]]):
+                return fun(*args, **kwargs)
+            if args[1][0] != '_' and self.metrics is not None:
+                self._attribute_counter(state, counters, args[1], '=').calls += 1
+            if args[1][0] != '_' and not detector.is_internal():
+                gate = self._attribute_gate(state, gates, args[1])
+                if gate is False or (gate is not None and not gate()):
+                    return fun(*args, **kwargs)
+                if self.debug:
+                    print(f"I''m setting {args[0]}.{args[1]} to {args[2]}")
+                self._emit(record, args, kwargs, None)
+            return fun(*args, **kwargs)
+
+        return _wrap_like(inner, fun)
 
 
 class FunctionHugger(BaseHugger):
-    pass
+    """Hug free functions, one at a time or a whole module at once.
+
+    Wrappers are installed into the namespace the function lives in. `disable()` puts the
+    original functions back, so calls made through that namespace while disabled cost
+    exactly what they did before hugging; `enable()` swaps the wrappers in again. A
+    wrapper returned by `hug` records whenever it is called directly.
+    """
+
+    def __init__(self, debug=False, live=None, detector=None, history=None, policy=None, metrics=False, values=None,
+                 background=None):
+        super().__init__(debug=debug, live=live, history=history, detector=detector, policy=policy, metrics=metrics,
+                         values=values, background=background)
+        self._installed = []
+        self._hugged = {}
+        self._wrappers = set()
+        self._detectors = {}
+
+    def hug(self, fun, namespace=None, name=None):
+        """Wrap `fun` and install the wrapper as `name` in `namespace`.
+
+        `namespace` defaults to the module `fun` was defined in, provided the function
+        can be found there under its own name. Hugging a wrapper, or a function already
+        installed under that name, returns the existing wrapper.
+        """
+        if fun in self._wrappers:
+            return fun
+        if name is None:
+            name = fun.__name__
+        if namespace is None:
+            namespace = sys.modules.get(getattr(fun, '__module__', None) or '')
+            if namespace is None or getattr(namespace, name, None) is not fun:
+                namespace = None
+        if namespace is not None:
+            hugged = self._hugged.get((id(namespace), name))
+            if hugged is not None and hugged[0] is fun:
+                return hugged[1]
+        owner = namespace if isinstance(namespace, types.ModuleType) and namespace.__name__ != '__main__' else None
+        gate = self._gate(getattr(owner, '__name__', None), name)
+        if gate is False:
+            # Never recorded by the policy, leave it alone
+            return fun
+        # Functions sharing a namespace share a detector, so calls between them are internal
+        scope = namespace if namespace is not None else fun
+        detector = self._detectors.get(id(scope))
+        if detector is None:
+            detector = self._detectors[id(scope)] = self.detector.bind(scope)
+        wrapper = self._wrap(fun, sys.intern(name), owner, detector, gate)
+        self._wrappers.add(wrapper)
+        if namespace is not None:
+            # Namespaces are kept alive by `_installed`, their id is stable
+            self._hugged[(id(namespace), name)] = (fun, wrapper)
+            self._installed.append((namespace, name, fun, wrapper))
+            if self.enabled:
+                setattr(namespace, name, wrapper)
+        return wrapper
+
+    def hug_module(self, module, names=None):
+        """Hug every public function (python or builtin) of `module`, or only `names`."""
+        if names is None:
+            names = [key for key, value in vars(module).items()
+                     if not key.startswith('_') and (inspect.isfunction(value) or inspect.isbuiltin(value))]
+        for name in names:
+            self.hug(getattr(module, name), namespace=module, name=name)
+        return module
+
+    def enable(self):
+        for namespace, name, _, wrapper in self._installed:
+            setattr(namespace, name, wrapper)
+        self.enabled = True
+
+    def disable(self):
+        # Last installed first, so a name hugged twice ends up with its first original
+        for namespace, name, fun, _ in reversed(self._installed):
+            setattr(namespace, name, fun)
+        self.enabled = False
+
+    def unhug(self):
+        """Put every original function back and forget the wrappers."""
+        self.disable()
+        self._installed.clear()
+        self._hugged.clear()
+        self._wrappers.clear()
+        self._detectors.clear()
+        self.enabled = True
+
+    def _wrap(self, fun, name, owner, detector, gate=None):
+        if inspect.iscoroutinefunction(fun) or inspect.isasyncgenfunction(fun):
+            return self._wrap_async(fun, name, owner, detector, gate)
+        call = self._instrument(detector.guard(fun), getattr(owner, '__name__', None), name)
+        deferred = self.pipeline is not None
+
+        def record(args, kwargs, res):
+            if deferred:
+                self._argument_checker(*args, **kwargs)
+            ret = self._argout(res)
+            self._record(self._makeScriptEntry(owner, CallType.FUNCTION, name, *args, returns=ret, **kwargs))
+
+        def inner(*args, **kwargs):
+            if detector.is_internal() or (gate is not None and not gate()):
+                return call(*args, **kwargs)
+            if self.debug:
+                print(f"I''m {name} and have been called with {args}, {kwargs}")
+            if not deferred:
+                self._argument_checker(*args, **kwargs)
+            res = call(*args, **kwargs)
+            self._emit(record, args, kwargs, res)
+            return res
+
+        return _wrap_like(inner, fun)
+
+    def _wrap_async(self, fun, name, owner, detector, gate=None):
+        """`_wrap` for async functions, recorded like the async members of `ClassHugger`."""
+        deferred = self.pipeline is not None
+
+        def record(args, kwargs, res, call_type=CallType.AWAIT):
+            if deferred:
+                self._argument_checker(*args, **kwargs)
+            ret = self._argout(res)
+            if call_type is CallType.AWAIT:
+                entry = self._makeScriptEntry(owner, call_type, None, name, *args, returns=ret, **kwargs)
+            else:
+                entry = self._makeScriptEntry(owner, call_type, name, *args, returns=ret, **kwargs)
+            self._record(entry)
+
+        if inspect.isasyncgenfunction(fun):
+            call = self._instrument(fun, getattr(owner, '__name__', None), name)
+
+            def record_call(args, kwargs, res):
+                record(args, kwargs, res, CallType.FUNCTION)
+
+            def inner(*args, **kwargs):
+                if detector.is_internal() or (gate is not None and not gate()):
+                    return call(*args, **kwargs)
+                if not deferred:
+                    self._argument_checker(*args, **kwargs)
+                res = _AsyncIterator(self, owner, call(*args, **kwargs), detector)
+                self._emit(record_call, args, kwargs, res)
+                return res
+        else:
+            call = self._instrument(detector.guard_async(fun), getattr(owner, '__name__', None), name)
+
+            async def inner(*args, **kwargs):
+                if detector.is_internal() or (gate is not None and not gate()):
+                    return await call(*args, **kwargs)
+                if not deferred:
+                    self._argument_checker(*args, **kwargs)
+                res = await call(*args, **kwargs)
+                self._emit(record, args, kwargs, res)
+                return res
+
+        return _wrap_like(inner, fun)
@@ -0,0 +1,153 @@
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+import inspect
+import json
+
+from functools import wraps
+from time import perf_counter_ns
+
+# Log-linear (HDR style) latency buckets: values below 2 ** _BITS ns get a bucket each,
+# above that every power of two is split into 2 ** (_BITS - 1) buckets, i.e. ~6% precision.
+_BITS = 5
+_LINEAR = 1 << _BITS
+_HALF = _LINEAR >> 1
+_N_BUCKETS = _LINEAR + (64 - _BITS) * _HALF
+
+
+def _bucket(value):
+    if value < _LINEAR:
+        return value
+    shift = value.bit_length() - _BITS
+    return _LINEAR + (shift - 1) * _HALF + (value >> shift) - _HALF
+
+
+def _bucket_bounds(index):
+    if index < _LINEAR:
+        return index, index
+    shift, mantissa = divmod(index - _LINEAR, _HALF)
+    shift += 1
+    return (_HALF + mantissa) << shift, ((_HALF + mantissa + 1) << shift) - 1
+
+
+class MemberMetrics:
+    """Counters and latency histogram of one `class.member`, allocated when it is hugged."""
+
+    __slots__ = ('name', 'calls', 'errors', 'total_ns', 'max_ns', 'buckets')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.buckets = [0] * _N_BUCKETS
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total_ns += elapsed
+        if elapsed > self.max_ns:
+            self.max_ns = elapsed
+        self.buckets[_bucket(elapsed)] += 1
+
+    def percentile(self, q):
+        """Latency in ns below which `q` percent of the timed calls fall (bucket upper bound)."""
+        timed = sum(self.buckets)
+        if not timed:
+            return 0
+        threshold = q / 100 * timed
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= threshold:
+                return min(_bucket_bounds(index)[1], self.max_ns)
+        return self.max_ns
+
+    def as_dict(self):
+        timed = sum(self.buckets)
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ns': self.total_ns,
+            'mean_ns': self.total_ns / timed if timed else 0,
+            'p50_ns': self.percentile(50),
+            'p90_ns': self.percentile(90),
+            'p99_ns': self.percentile(99),
+            'max_ns': self.max_ns,
+        }
+
+
+class Metrics:
+    """Per-member call counts, latency histograms and exception counts.
+
+    Timing costs two `perf_counter_ns` calls per call. Attribute accesses are only counted.
+    """
+
+    def __init__(self):
+        self._members = {}
+
+    def slot(self, owner, member):
+        name = member if owner is None else f'{owner}.{member}'
+        slot = self._members.get(name)
+        if slot is None:
+            slot = self._members[name] = MemberMetrics(name)
+        return slot
+
+    def instrument(self, fun, owner, member):
+        """Wrap `fun` so that every call is timed into the slot of `owner.member`.
+
+        Coroutine functions are timed until their result, time spent suspended included.
+        """
+        slot = self.slot(owner, member)
+        add = slot.add
+
+        if inspect.iscoroutinefunction(fun):
+            @wraps(fun)
+            async def timed(*args, **kwargs):
+                start = perf_counter_ns()
+                try:
+                    return await fun(*args, **kwargs)
+                except BaseException:
+                    slot.errors += 1
+                    raise
+                finally:
+                    add(perf_counter_ns() - start)
+
+            return timed
+
+        @wraps(fun)
+        def timed(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return fun(*args, **kwargs)
+            except BaseException:
+                slot.errors += 1
+                raise
+            finally:
+                add(perf_counter_ns() - start)
+
+        return timed
+
+    def __getitem__(self, name):
+        return self._members[name]
+
+    def __iter__(self):
+        return iter(self._members.values())
+
+    def reset(self):
+        for slot in self._members.values():
+            slot.__init__(slot.name)
+
+    def snapshot(self):
+        """Plain dict of `class.member` -> statistics, for members called at least once."""
+        return {name: slot.as_dict() for name, slot in self._members.items() if slot.calls}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def dump(self, fp, **kwargs):
+        json.dump(self.snapshot(), fp, **kwargs)
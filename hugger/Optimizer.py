@@ -0,0 +1,270 @@
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+from hugger.Hugger import CallType, HistoryEntry, Loop, Symbol
+
+# Passes assume properties and attributes behave like plain storage: a get returns the last
+# value set and has no other effect, a set only stores its value. Calls may do anything with
+# the objects they are given, and with anything those objects were handed before.
+
+_UNKNOWN = object()
+_CALLS = (CallType.CREATE_OBJ, CallType.FN_CALL, CallType.MAGIC_METHOD, CallType.FUNCTION, CallType.AWAIT)
+
+
+def _uses(entry):
+    """Symbols read by `entry`."""
+    if entry.call_obj is not None:
+        yield entry.call_obj
+    for arg in entry.args:
+        if isinstance(arg, Symbol):
+            yield arg
+    if entry.kwargs:
+        for item in entry.kwargs.values():
+            if isinstance(item, Symbol):
+                yield item
+
+
+def _arguments(entry):
+    """Symbols handed to `entry` as values, i.e. which may be kept by the callee."""
+    values = list(entry.args)
+    if entry.kwargs:
+        values.extend(entry.kwargs.values())
+    return [value for value in values if isinstance(value, Symbol)]
+
+
+class _Stores:
+    """Property sets nothing has observed yet, as object symbol -> {member: what the pass keeps}."""
+
+    def __init__(self):
+        self.pending = {}
+        self._escaped = set()
+        self._escaped_pending = set()
+
+    def observe(self, symbol):
+        self.pending.pop(symbol, None)
+
+    def store(self, symbol, member, item):
+        self.pending.setdefault(symbol, {})[member] = item
+        if symbol in self._escaped:
+            self._escaped_pending.add(symbol)
+
+    def visit(self, entry):
+        """Account for everything `entry` may observe, except a set's own target."""
+        for symbol in _arguments(entry):
+            self._escaped.add(symbol)
+            self.observe(symbol)
+        if entry.call_type is not CallType.CREATE_OBJ and entry.call_type is not CallType.LOAD_VALUE:
+            # Returned objects may be reachable from elsewhere as well
+            self._escaped.update(entry.returns)
+        if entry.call_type is CallType.PROP_GET:
+            self.observe(entry.call_obj)
+        elif entry.call_type in _CALLS:
+            if entry.call_obj is not None:
+                self.observe(entry.call_obj)
+            # Anything handed to some object before may be read through it now
+            for symbol in self._escaped_pending:
+                self.observe(symbol)
+            self._escaped_pending.clear()
+
+
+def fold_constants(entries):
+    """Drop gets of a literal stored by an earlier set and use the literal instead.
+
+    Returns the new entries and the number of gets removed.
+    """
+    stores = _Stores()
+    substitute = {}
+    result = []
+    removed = 0
+    for entry in entries:
+        if substitute and any(symbol in substitute for symbol in _uses(entry)):
+            entry = _substituted(entry, substitute)
+        call_type = entry.call_type
+        if call_type is CallType.PROP_GET and not entry.args and not entry.kwargs and len(entry.returns) == 1:
+            known = stores.pending.get(entry.call_obj, {}).get(entry.member, _UNKNOWN)
+            if known is not _UNKNOWN:
+                substitute[entry.returns[0]] = known
+                removed += 1
+                continue
+        stores.visit(entry)
+        if call_type is CallType.PROP_SET:
+            value = entry.args[0]
+            if isinstance(value, Symbol):
+                stores.pending.get(entry.call_obj, {}).pop(entry.member, None)
+            else:
+                stores.store(entry.call_obj, entry.member, value)
+        result.append(entry)
+    return result, removed
+
+
+def _substituted(entry, substitute):
+    args = tuple(substitute.get(arg, arg) if isinstance(arg, Symbol) else arg for arg in entry.args)
+    kwargs = entry.kwargs
+    if kwargs:
+        kwargs = {key: substitute.get(item, item) if isinstance(item, Symbol) else item for key, item in kwargs.items()}
+    return HistoryEntry(entry.class_obj, entry.call_type, entry.call_obj, entry.member, args, kwargs, entry.returns)
+
+
+def eliminate_dead_stores(entries):
+    """Drop property sets which are overwritten before anything can observe them.
+
+    Returns the new entries and the number of sets removed.
+    """
+    stores = _Stores()
+    dead = set()
+    for index, entry in enumerate(entries):
+        stores.visit(entry)
+        if entry.call_type is CallType.PROP_SET:
+            previous = stores.pending.get(entry.call_obj, {}).get(entry.member)
+            if previous is not None:
+                dead.add(previous)
+            stores.store(entry.call_obj, entry.member, index)
+    return [entry for index, entry in enumerate(entries) if index not in dead], len(dead)
+
+
+def remove_unused_gets(entries):
+    """Drop property gets whose results are never used, including chains of them.
+
+    Returns the new entries and the number of gets removed.
+    """
+    used = set()
+    kept = []
+    for entry in reversed(entries):
+        if entry.call_type is CallType.PROP_GET and not any(ret in used for ret in entry.returns):
+            continue
+        used.update(_uses(entry))
+        kept.append(entry)
+    kept.reverse()
+    return kept, len(entries) - len(kept)
+
+
+class _Literal:
+    """Stands for any literal in the shape of an entry."""
+
+
+def _shape(entry):
+    """What must match for two entries to be repetitions of each other, and their literals."""
+    literals = []
+    args = []
+    for arg in entry.args:
+        if isinstance(arg, Symbol):
+            args.append(arg)
+        else:
+            args.append(_Literal)
+            literals.append(arg)
+    kwargs = ()
+    if entry.kwargs:
+        kwargs = []
+        for key, item in entry.kwargs.items():
+            if isinstance(item, Symbol):
+                kwargs.append((key, item))
+            else:
+                kwargs.append((key, _Literal))
+                literals.append(item)
+        kwargs = tuple(kwargs)
+    return (entry.class_obj, entry.call_type, entry.call_obj, entry.member, tuple(args), kwargs), literals
+
+
+def _loop(entries, shapes, start, period, count):
+    """Turn `count` repetitions of `period` entries from `start` into a `Loop`."""
+    body = []
+    names = []
+    columns = []
+    for offset in range(period):
+        entry = entries[start + offset]
+        literals = shapes[start + offset][1]
+        variable = []
+        for position, value in enumerate(literals):
+            column = [shapes[start + offset + period * rep][1][position] for rep in range(count)]
+            if all(type(item) is type(value) and item == value for item in column):
+                variable.append(value)
+            else:
+                name = Symbol(f'_a{len(names)}')
+                names.append(name)
+                columns.append(column)
+                variable.append(name)
+        values = iter(variable)
+        args = tuple(arg if isinstance(arg, Symbol) else next(values) for arg in entry.args)
+        kwargs = entry.kwargs
+        if kwargs:
+            kwargs = {key: item if isinstance(item, Symbol) else next(values) for key, item in kwargs.items()}
+        body.append(HistoryEntry(entry.class_obj, entry.call_type, entry.call_obj, entry.member, args, kwargs))
+    return Loop(body, names, columns, count)
+
+
+def compress_loops(entries, min_repeats=3, max_period=8):
+    """Fold runs of at least `min_repeats` repetitions of up to `max_period` entries into loops.
+
+    Repetitions may only differ in literal arguments. Entries creating objects or whose
+    results are used later are never folded. Must be the last pass, the others do not
+    look into loops. Returns the new entries and the number of entries removed: those
+    folded, less the loops replacing them.
+    """
+    used = set()
+    for entry in entries:
+        used.update(_uses(entry))
+    shapes = []
+    for entry in entries:
+        if entry.call_type in (CallType.CREATE_OBJ, CallType.LOAD_VALUE) or any(ret in used for ret in entry.returns):
+            shapes.append(None)
+        else:
+            shapes.append(_shape(entry))
+    keys = [None if shape is None else shape[0] for shape in shapes]
+    result = []
+    removed = 0
+    index = 0
+    n = len(entries)
+    while index < n:
+        best_period = best_count = 0
+        for period in range(1, max_period + 1):
+            block = keys[index:index + period]
+            if len(block) < period or None in block:
+                break
+            count = 1
+            while keys[index + count * period:index + (count + 1) * period] == block:
+                count += 1
+            if count >= min_repeats and period * count > best_period * best_count:
+                best_period, best_count = period, count
+        if best_count:
+            result.append(_loop(entries, shapes, index, best_period, best_count))
+            # The loop itself stays in the history
+            removed += best_period * best_count - 1
+            index += best_period * best_count
+        else:
+            result.append(entries[index])
+            index += 1
+    return result, removed
+
+
+PASSES = {
+    'fold_constants': fold_constants,
+    'dead_stores': eliminate_dead_stores,
+    'unused_gets': remove_unused_gets,
+    'loops': compress_loops,
+}
+
+
+class OptimizedHistory(list):
+    """Entries left by `optimize`, with `report` mapping each pass to the events it removed."""
+
+    def __init__(self, entries, report):
+        super().__init__(entries)
+        self.report = report
+
+
+def optimize(history, passes=tuple(PASSES)):
+    """Run the optimization `passes` over `history`, in order, before making a script.
+
+        script = hugger.makeScript(optimize(hugger.history))
+
+    The recorded history is left untouched.
+    """
+    entries = list(history)
+    report = {}
+    for name in passes:
+        entries, report[name] = PASSES[name](entries)
+    return OptimizedHistory(entries, report)
@@ -0,0 +1,124 @@
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+import threading
+import time
+
+from collections import deque
+
+BACKPRESSURE = ('block', 'drop', 'sample')
+
+
+class RecordingPipeline:
+    """Bounded queue of raw events, turned into history entries by a background thread.
+
+    Hugged calls only append `(normalizer, args, kwargs, result)` to the queue, where the
+    normalizer is the per-member function doing the recording work: naming arguments and
+    results, building the entry, appending it to the history and writing live or
+    segmented output. A worker thread runs them in the order they were queued. The raw
+    tuples keep their objects alive until then, so ids stay valid.
+
+    `backpressure` decides what happens to an event when `maxsize` events are waiting:
+    'block' waits for room, 'drop' discards it, 'sample' discards it except one in
+    `sample_every`, which waits. Object creation always waits, later entries refer to the
+    names it defines. Dropped events are counted in `dropped`; as with a sampling
+    `RecordingPolicy`, later entries may refer to objects returned by a dropped call.
+    """
+
+    def __init__(self, maxsize=65536, backpressure='block', sample_every=10, interval=0.0001):
+        if backpressure not in BACKPRESSURE:
+            raise ValueError(f'Unknown backpressure mode {backpressure}')
+        self.maxsize = maxsize
+        self.backpressure = backpressure
+        self.sample_every = sample_every
+        self.interval = interval
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self._skipped = 0
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='hugger-pipeline', daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """Number of events waiting."""
+        return len(self._buffer)
+
+    def push(self, record, args, kwargs, result, required=False):
+        buffer = self._buffer
+        if len(buffer) >= self.maxsize and not self._room(required):
+            return
+        buffer.append((record, args, kwargs, result))
+        if self._idle:
+            self._wakeup.set()
+
+    def _room(self, required):
+        """Apply the backpressure to an event which found the queue full, False to drop it."""
+        if threading.current_thread() is self._thread:
+            # Recorded while normalizing, waiting would never end
+            return True
+        if not required and self.backpressure != 'block':
+            with self._lock:
+                self._skipped += 1
+                keep = self.backpressure == 'sample' and self._skipped % self.sample_every == 0
+                if not keep:
+                    self.dropped += 1
+            if not keep:
+                return False
+        while len(self._buffer) >= self.maxsize:
+            self._wakeup.set()
+            time.sleep(self.interval)
+        return True
+
+    def _run(self):
+        buffer = self._buffer
+        popleft = buffer.popleft
+        wakeup = self._wakeup
+        while True:
+            try:
+                item = popleft()
+            except IndexError:
+                if self._closed:
+                    return
+                # Producers only pay for the wakeup while the worker is waiting
+                self._idle = True
+                wakeup.clear()
+                if not buffer and not self._closed:
+                    wakeup.wait()
+                self._idle = False
+                continue
+            if type(item) is not tuple:
+                # A `flush` marker
+                item.set()
+                continue
+            record, args, kwargs, result = item
+            try:
+                record(args, kwargs, result)
+            except Exception as error:
+                self.errors += 1
+                self.last_error = error
+
+    def flush(self, timeout=None):
+        """Wait until every event queued so far has been recorded."""
+        if threading.current_thread() is self._thread or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._buffer.append(done)
+        self._wakeup.set()
+        done.wait(timeout)
+
+    def close(self):
+        """Record what is queued and stop the worker."""
+        self.flush()
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
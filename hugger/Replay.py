@@ -0,0 +1,286 @@
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+import gc
+
+from array import array
+from bisect import bisect_left
+from time import perf_counter_ns
+
+from hugger.Hugger import CallType, Symbol, _awaits
+from hugger.Values import LOADER, ValueLoader
+
+_LOADER_PREFIX = f'{LOADER}["'
+
+
+def _value_key(symbol):
+    """Key of a value store reference such as `_values["..."]`, None for other symbols."""
+    if symbol.startswith(_LOADER_PREFIX):
+        return symbol[len(_LOADER_PREFIX):-2]
+    return None
+
+
+class Replayer:
+    """Execute a history directly against the real classes, without generating a script.
+
+    `history` is anything iterable giving entries: a hugger's `history`, a `SessionReader`,
+    `read_segments(...)` or an optimized history. `namespace` maps the class, module and
+    function names used in the history to the objects to call, like the globals a script
+    would be run with. `values` is the `ValueLoader` (or its directory) for histories
+    recorded with a value store.
+
+    Every entry is compiled up front into a step with its callable and literal arguments
+    resolved, leaving only symbol lookups for run time. Live objects are kept in `symbols`,
+    keyed by their var_/obj_/class_N name. `position` is the index of the next step.
+    Histories with awaited calls are replayed from a coroutine with `arun`.
+    """
+
+    def __init__(self, history, namespace=None, values=None):
+        self.namespace = {} if namespace is None else namespace
+        self.values = ValueLoader(values) if isinstance(values, str) else values
+        self.symbols = {}
+        self.timings = array('Q')
+        self.position = 0
+        # Indices of the steps which are coroutines, in order
+        self._awaits = []
+        # The plan is millions of small closures for big sessions, which would otherwise
+        # trigger full collections over everything allocated so far
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            self._steps = steps = []
+            for entry in history:
+                if _awaits(entry):
+                    self._awaits.append(len(steps))
+                steps.append(self._compile(entry))
+        finally:
+            if enabled:
+                gc.enable()
+
+    def __len__(self):
+        return len(self._steps)
+
+    def _lookup(self, name):
+        try:
+            return self.namespace[name]
+        except KeyError:
+            raise NameError(f"name '{name}' is not defined in the replay namespace") from None
+
+    def _resolver(self, value):
+        """A constant, or a callable fetching the value of a symbol at run time."""
+        if not isinstance(value, Symbol):
+            return value, False
+        key = _value_key(value)
+        if key is not None:
+            return (lambda: self.values[key]), True
+        symbols = self.symbols
+        return (lambda: symbols[value]), True
+
+    def _arguments(self, args, kwargs):
+        """Callable building the call arguments, constants are shared between calls."""
+        args = [self._resolver(arg) for arg in args]
+        kwargs = {key: self._resolver(item) for key, item in (kwargs or {}).items()}
+        if not any(dynamic for _, dynamic in args) and not any(dynamic for _, dynamic in kwargs.values()):
+            constant = (tuple(value for value, _ in args), {key: value for key, (value, _) in kwargs.items()})
+            return lambda: constant
+        return lambda: (tuple(value() if dynamic else value for value, dynamic in args),
+                        {key: value() if dynamic else value for key, (value, dynamic) in kwargs.items()})
+
+    def _assign(self, returns):
+        symbols = self.symbols
+        if not returns:
+            return lambda result: None
+        if len(returns) == 1:
+            symbol = returns[0]
+
+            def assign(result):
+                symbols[symbol] = result
+            return assign
+
+        def unpack(result):
+            symbols.update(zip(returns, result))
+        return unpack
+
+    def _compile(self, entry):
+        call_type = entry.call_type
+        if call_type is None:
+            return self._compile_loop(entry)
+        assign = self._assign(entry.returns)
+        if call_type is CallType.LOAD_VALUE:
+            key = _value_key(entry.member)
+
+            def step():
+                result = self.values[key]
+                assign(result)
+                return result
+            return step
+        if call_type is CallType.PROP_SET:
+            target, _ = self._resolver(entry.call_obj)
+            value, dynamic = self._resolver(entry.args[0])
+            member = entry.member
+
+            def step():
+                setattr(target(), member, value() if dynamic else value)
+            return step
+        if call_type is CallType.PROP_GET:
+            target, _ = self._resolver(entry.call_obj)
+            member = entry.member
+
+            def step():
+                result = getattr(target(), member)
+                assign(result)
+                return result
+            return step
+        arguments = self._arguments(entry.args, entry.kwargs)
+        if call_type is CallType.AWAIT:
+            return self._compile_await(entry, arguments, assign)
+        if call_type is CallType.FN_CALL:
+            target, _ = self._resolver(entry.call_obj)
+            member = entry.member
+
+            def step():
+                args, kwargs = arguments()
+                result = getattr(target(), member)(*args, **kwargs)
+                assign(result)
+                return result
+            return step
+        if call_type is CallType.CREATE_OBJ:
+            fun = self._lookup(entry.class_obj)
+        elif call_type is CallType.MAGIC_METHOD:
+            fun = getattr(self._lookup(entry.class_obj), entry.member)
+        elif call_type is CallType.FUNCTION:
+            if entry.class_obj is None:
+                fun = self._lookup(entry.member)
+            else:
+                fun = getattr(self._lookup(entry.class_obj), entry.member)
+        else:
+            raise ValueError(f'Unknown call type {call_type}')
+
+        def step():
+            args, kwargs = arguments()
+            result = fun(*args, **kwargs)
+            assign(result)
+            return result
+        return step
+
+    def _compile_await(self, entry, arguments, assign):
+        member = entry.member
+        if entry.call_obj is not None:
+            target, _ = self._resolver(entry.call_obj)
+
+            def fun():
+                return getattr(target(), member)
+        else:
+            function = self._lookup(member) if entry.class_obj is None else \
+                getattr(self._lookup(entry.class_obj), member)
+
+            def fun():
+                return function
+
+        async def step():
+            args, kwargs = arguments()
+            result = await fun()(*args, **kwargs)
+            assign(result)
+            return result
+        return step
+
+    def _compile_loop(self, loop):
+        body = [self._compile(entry) for entry in loop.body]
+        symbols = self.symbols
+        names = loop.names
+        rows = list(zip(*loop.columns)) if names else [()] * loop.count
+        if _awaits(loop):
+            awaited = [_awaits(entry) for entry in loop.body]
+
+            async def step():
+                for row in rows:
+                    symbols.update(zip(names, row))
+                    for body_step, awaits in zip(body, awaited):
+                        if awaits:
+                            await body_step()
+                        else:
+                            body_step()
+            return step
+
+        def step():
+            for row in rows:
+                symbols.update(zip(names, row))
+                for body_step in body:
+                    body_step()
+        return step
+
+    def _check_sync(self, stop):
+        index = bisect_left(self._awaits, self.position)
+        if index < len(self._awaits) and self._awaits[index] < stop:
+            raise TypeError(f'Entry {self._awaits[index]} awaits, replay it with arun()')
+
+    def step(self, timing=False):
+        """Replay the next entry and return its result."""
+        self._check_sync(self.position + 1)
+        step = self._steps[self.position]
+        if timing:
+            start = perf_counter_ns()
+            result = step()
+            self.timings.append(perf_counter_ns() - start)
+        else:
+            result = step()
+        self.position += 1
+        return result
+
+    def run(self, stop=None, timing=False):
+        """Replay up to, not including, entry `stop` (default: the end).
+
+        If `timing` is set the duration of every step in ns is appended to `timings`.
+        An exception leaves `position` on the entry which raised it.
+        """
+        stop = len(self._steps) if stop is None else min(stop, len(self._steps))
+        self._check_sync(stop)
+        steps = self._steps
+        position = self.position
+        try:
+            if timing:
+                timings = self.timings
+                while position < stop:
+                    start = perf_counter_ns()
+                    steps[position]()
+                    timings.append(perf_counter_ns() - start)
+                    position += 1
+            else:
+                while position < stop:
+                    steps[position]()
+                    position += 1
+        finally:
+            self.position = position
+        return self
+
+    async def arun(self, stop=None, timing=False):
+        """`run` from a coroutine, awaiting the entries recorded as awaited calls in turn."""
+        stop = len(self._steps) if stop is None else min(stop, len(self._steps))
+        steps = self._steps
+        awaits = set(self._awaits)
+        timings = self.timings
+        position = self.position
+        try:
+            while position < stop:
+                if timing:
+                    start = perf_counter_ns()
+                result = steps[position]()
+                if position in awaits:
+                    await result
+                if timing:
+                    timings.append(perf_counter_ns() - start)
+                position += 1
+        finally:
+            self.position = position
+        return self
+
+    def batches(self, size, stop=None, timing=False):
+        """Replay `size` entries at a time, yielding the position after each batch."""
+        stop = len(self._steps) if stop is None else min(stop, len(self._steps))
+        while self.position < stop:
+            self.run(min(self.position + size, stop), timing)
+            yield self.position
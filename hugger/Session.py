@@ -0,0 +1,153 @@
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+import marshal
+import mmap
+import struct
+
+from array import array
+
+from hugger.History import decode_entry, encode_entry
+from hugger.Hugger import CallType
+
+# Layout of a session file:
+#
+#   MAGIC
+#   event records           encode_entry() bytes, back to back
+#   padding                 to an 8 byte boundary
+#   index block             (n + 1) uint64 record offsets, n uint32 class ids, n uint8 call types
+#   classes block           marshal list of class names (class id -> name)
+#   symbols block           marshal dict of instance/var/ret symbol names
+#   footer                  n, index offset, classes offset, symbols offset, MAGIC
+SESSION_MAGIC = b'HUGSESS1'
+_FOOTER = struct.Struct('<QQQQ8s')
+
+
+def save_session(hugger, path, history=None):
+    """Write the history and symbol tables of `hugger` to the binary session file `path`.
+
+    `history` defaults to the recorded history of the hugger.
+    """
+    offsets = array('Q')
+    class_ids = array('I')
+    call_types = array('B')
+    classes = {}
+    with open(path, 'wb') as fp:
+        fp.write(SESSION_MAGIC)
+        position = len(SESSION_MAGIC)
+        # `history` waits for a background pipeline to record what is queued
+        for entry in hugger.history if history is None else history:
+            data = encode_entry(entry)
+            offsets.append(position)
+            class_ids.append(classes.setdefault(entry.class_obj, len(classes)))
+            call_types.append(entry.call_type)
+            fp.write(data)
+            position += len(data)
+        offsets.append(position)
+        padding = -position % 8
+        fp.write(bytes(padding))
+        index_offset = position + padding
+        fp.write(offsets.tobytes())
+        fp.write(class_ids.tobytes())
+        fp.write(call_types.tobytes())
+        classes_offset = index_offset + len(offsets) * 8 + len(class_ids) * 4 + len(call_types)
+        data = marshal.dumps(list(classes))
+        fp.write(data)
+        symbols_offset = classes_offset + len(data)
+        symbols = hugger._symbols
+        fp.write(marshal.dumps({
+            'instances': [str(symbols[obj_id]) for obj_id in hugger._create_list if obj_id in symbols],
+            'vars': [str(symbols[obj_id]) for obj_id in hugger._unique_vars if obj_id in symbols],
+            'rets': [str(symbols[obj_id]) for obj_id in hugger._unique_rets if obj_id in symbols],
+        }))
+        fp.write(_FOOTER.pack(len(call_types), index_offset, classes_offset, symbols_offset, SESSION_MAGIC))
+
+
+class SessionReader:
+    """Memory-mapped, lazily decoded view of a session written by `save_session`.
+
+    Entries are only decoded when accessed, so arbitrarily large sessions can be
+    indexed, filtered and turned back into a script without loading them into memory:
+
+        with SessionReader(path) as session:
+            ClassHugger().write_script(fp, session)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._view = self._offsets = self._class_ids = self._call_types = None
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(SESSION_MAGIC)] != SESSION_MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a hugger session file')
+        n, index_offset, classes_offset, symbols_offset, magic = _FOOTER.unpack_from(
+            self._map, len(self._map) - _FOOTER.size)
+        if magic != SESSION_MAGIC:
+            self.close()
+            raise ValueError(f'{path} is truncated')
+        self._view = view = memoryview(self._map)
+        start = index_offset
+        self._offsets = view[start:start + (n + 1) * 8].cast('Q')
+        start += (n + 1) * 8
+        self._class_ids = view[start:start + n * 4].cast('I')
+        start += n * 4
+        self._call_types = view[start:start + n]
+        self.classes = marshal.loads(self._map[classes_offset:symbols_offset])
+        self.symbols = marshal.loads(self._map[symbols_offset:len(self._map) - _FOOTER.size])
+        self._length = n
+
+    def close(self):
+        for view in (self._offsets, self._class_ids, self._call_types, self._view):
+            if view is not None:
+                view.release()
+        self._view = self._offsets = self._class_ids = self._call_types = None
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('session index out of range')
+        return decode_entry(self._map[self._offsets[index]:self._offsets[index + 1]])
+
+    def __iter__(self):
+        for index in range(self._length):
+            yield self[index]
+
+    def indices(self, class_obj=None, call_type=None):
+        """Indices of the events matching `class_obj` and/or `call_type`, from the index block only."""
+        call_types = self._call_types
+        if call_type is not None:
+            call_type = int(CallType[call_type.upper()] if isinstance(call_type, str) else call_type)
+        if class_obj is None:
+            if call_type is None:
+                return list(range(self._length))
+            return [i for i, t in enumerate(call_types) if t == call_type]
+        if class_obj not in self.classes:
+            return []
+        class_id = self.classes.index(class_obj)
+        if call_type is None:
+            return [i for i, c in enumerate(self._class_ids) if c == class_id]
+        return [i for i, (c, t) in enumerate(zip(self._class_ids, call_types)) if c == class_id and t == call_type]
+
+    def filter(self, class_obj=None, call_type=None):
+        """Yield the entries matching `class_obj` and/or `call_type`."""
+        for index in self.indices(class_obj, call_type):
+            yield self[index]
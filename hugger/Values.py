@@ -0,0 +1,137 @@
+#   Licensed under the GNU General Public License v3.0
+#   Copyright (c) of the author (github.com/wardsimon)
+#   Created: 18/10/2026.
+
+__author__ = 'github.com/wardsimon'
+__version__ = '0.0.1'
+
+import hashlib
+import os
+import pickle
+import threading
+
+# Name of the loader in generated scripts
+LOADER = '_values'
+
+
+def _is_ndarray(value):
+    # Checked by name so numpy is only imported when arrays are actually seen
+    return type(value).__name__ == 'ndarray' and type(value).__module__ == 'numpy'
+
+
+def _literal_size(value, limit):
+    """Approximate length of the literal `value` in a script, counted until `limit`.
+
+    Containers are measured through their items, so a small tuple holding a large string
+    is as large as the string.
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, int):
+        # Decimal digits, a little over
+        return value.bit_length() // 3 + 1
+    if isinstance(value, (tuple, frozenset)):
+        size = 2
+        for item in value:
+            size += _literal_size(item, limit - size) + 2
+            if size >= limit:
+                break
+        return size
+    # float, complex, None: a few dozen characters at most
+    return 24
+
+
+class ValueStore:
+    """Side store for argument values which do not belong inline in a generated script.
+
+    Values are written once, named by the hash of their content, to `directory`: numpy
+    arrays as `.npy` files, anything else picklable as a `.pkl` file. Immutable literals
+    (str, bytes, tuples, ...) are only stored above `threshold` bytes. Mutable arguments
+    have no literal form at all, so every picklable one is stored, which also defines the
+    `var_N` names the script uses for them. Values are saved as they are when first seen.
+    """
+
+    def __init__(self, directory, threshold=4096):
+        self.directory = os.path.abspath(directory)
+        self.threshold = threshold
+        self._keys = set()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def preamble(self):
+        """Script lines creating the loader the stored values are read through."""
+        return f'from hugger.Values import ValueLoader\n{LOADER} = ValueLoader({self.directory!r})\n\n'
+
+    @staticmethod
+    def reference(key):
+        """Script expression loading the value stored under `key`."""
+        return f'{LOADER}["{key}"]'
+
+    def wants(self, value):
+        """Whether the immutable literal `value` is too large to be written inline."""
+        return _literal_size(value, self.threshold) >= self.threshold
+
+    def put(self, value):
+        """Store `value` and return its key, None if it cannot be stored."""
+        try:
+            if _is_ndarray(value) and not value.dtype.hasobject:
+                return self._put_array(value)
+            return self._put_pickle(value)
+        except Exception:
+            # Recording must not fail the recorded call, the value is just not stored
+            return None
+
+    def _put_pickle(self, value):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        key = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if key not in self._keys:
+            path = os.path.join(self.directory, f'{key}.pkl')
+            if not os.path.exists(path):
+                self._write(path, data)
+            self._keys.add(key)
+        return key
+
+    def _put_array(self, value):
+        import numpy
+        value = numpy.ascontiguousarray(value)
+        digest = hashlib.blake2b(f'{value.dtype.str}{value.shape}'.encode(), digest_size=16)
+        # Raw bytes, buffers refuse some dtypes such as datetime64
+        digest.update(value.view(numpy.uint8) if value.ndim else value.tobytes())
+        key = digest.hexdigest()
+        if key not in self._keys:
+            path = os.path.join(self.directory, f'{key}.npy')
+            if not os.path.exists(path):
+                numpy.save(path, value, allow_pickle=False)
+            self._keys.add(key)
+        return key
+
+    @staticmethod
+    def _write(path, data):
+        # Write then rename, a concurrent reader never sees a partial file
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp, 'wb') as fp:
+            fp.write(data)
+        os.replace(temp, path)
+
+
+class ValueLoader:
+    """Lazily load the values of a `ValueStore`, as used by generated scripts.
+
+    A value is read from disk the first time it is needed. Every lookup returns a new
+    object, so variables which happened to hold equal content stay distinct objects.
+    Arrays are memory-mapped copy-on-write: only the pages which are touched are read.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._data = {}
+
+    def __getitem__(self, key):
+        data = self._data.get(key)
+        if data is None:
+            path = os.path.join(self.directory, f'{key}.npy')
+            if os.path.exists(path):
+                import numpy
+                return numpy.load(path, mmap_mode='c', allow_pickle=False)
+            with open(os.path.join(self.directory, f'{key}.pkl'), 'rb') as fp:
+                data = self._data[key] = fp.read()
+        return pickle.loads(data)
@@ -3,4 +3,12 @@ __version__ = '0.0.1'
 
 from hugger.Hugger import ClassHugger
 from hugger.Hugger import FunctionHugger
-
+from hugger.Hugger import CallDetector, DepthCallDetector, FrameCallDetector, StackCallDetector
+from hugger.Hugger import RecordingPolicy
+from hugger.Metrics import Metrics
+from hugger.Optimizer import optimize
+from hugger.Pipeline import RecordingPipeline
+from hugger.Replay import Replayer
+from hugger.Values import ValueLoader, ValueStore
+from hugger.History import ConcurrentHistory, RingHistory, SegmentedHistory, read_segments
+from hugger.Session import SessionReader, save_session